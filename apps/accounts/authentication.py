@@ -0,0 +1,99 @@
+"""
+JWT authentication without a database query for the safe methods.
+
+The access tokens carry the claims the permission classes need (see
+UserTokenObtainPairSerializer), so a GET, HEAD or OPTIONS request is authenticated
+with a `TokenUser` built from the token, and the group permissions come from the
+cache (see common.permissions). Writes still load the user row.
+
+A token stays valid until it expires, so the changes that must end the sessions of a
+user (password, active or admin flags, deletion) record a revocation time on the user
+row, and the tokens issued before it are rejected (see revoke_user_tokens). The safe
+methods read it, with the active flag, through a short lived cache entry dropped on
+revocation, the other processes see a revocation at the latest when theirs expires.
+"""
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from .models import User
+
+
+# Time of the login the token descends from (in seconds, with a fraction so a token
+# issued right after a revocation is told apart), refreshed access tokens keep it
+AUTH_TIME_CLAIM = 'auth_time'
+
+
+# Seconds the state of a user read by the safe methods is cached for
+TOKEN_STATE_CACHE_TIMEOUT = 60
+
+
+def _token_state_key(user_id):
+    return f'accounts:token_state:{user_id}'
+
+
+def revoke_user_tokens(user_ids):
+    """
+    Reject the tokens of the users issued until now, returns the revocation time.
+    """
+    revoked_at = timezone.now()
+    User.all_objects.filter(pk__in=user_ids).update(tokens_revoked_at=revoked_at)
+    cache.delete_many([_token_state_key(user_id) for user_id in user_ids])
+    return revoked_at
+
+
+def _token_state(user_id):
+    """
+    Whether the user can still authenticate, and when their tokens were last revoked.
+    """
+    key = _token_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        user = User.objects.filter(pk=user_id, is_active=True).values('tokens_revoked_at').first()
+        state = (user is not None, user and user['tokens_revoked_at'])
+        cache.set(key, state, timeout=TOKEN_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def issued_before(token, revoked_at):
+    if revoked_at is None:
+        return False
+    return token.get(AUTH_TIME_CLAIM, token['iat']) <= revoked_at.timestamp()
+
+
+class UserJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with the user built from the token claims on safe methods.
+    """
+
+    stateless_methods = SAFE_METHODS
+
+    def authenticate(self, request):
+        self.stateless = request.method in self.stateless_methods
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if not self.stateless:
+            user = super().get_user(validated_token)
+            revoked_at = user.tokens_revoked_at
+        else:
+            user = TokenUser(validated_token)
+            active, revoked_at = _token_state(user.pk)
+            if not active:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if issued_before(validated_token, revoked_at):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        return user
+
+
+class DatabaseUserJWTAuthentication(UserJWTAuthentication):
+    """
+    For the views that need the user row on every method, e.g. to serialize it.
+    """
+
+    stateless_methods = ()
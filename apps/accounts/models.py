@@ -43,12 +43,33 @@ class User(AbstractUser, BaseModel):
         blank=True,
         null=True,
     )
+    # Resized copies of the avatar by size in pixels, see apps.accounts.tasks.process_avatar
+    avatar_renditions = models.JSONField(default=dict, blank=True)
+    # The tokens issued until then are rejected, see apps.accounts.authentication
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ['first_name', 'last_name']
 
+    # The Meta of AbstractUser comes first in the MRO, add the indexes of BaseModel back
+    class Meta(AbstractUser.Meta):
+        indexes = BaseModel.Meta.indexes
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Only written by revoke_user_tokens, a stale instance must not move it back
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name != 'tokens_revoked_at'
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     # class Meta:
     #     # Explicitly set the database table name
     #     db_table = 'custom_table_name'
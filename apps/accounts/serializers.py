@@ -1,17 +1,20 @@
+import time
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
+from common.mail import queue_email
+from common.permissions import has_group_permission
+from .authentication import AUTH_TIME_CLAIM
 from .models import User
+from .tokens import UserRefreshToken
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -29,6 +32,8 @@ class PermissionSerializer(serializers.ModelSerializer):
 
 
 class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = UserRefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -36,11 +41,20 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Add custom claims to the payload (not the token itself)
         token['user_id'] = user.id
         token['email'] = user.email
+        # Read by the TokenUser of UserJWTAuthentication, and copied to refreshed tokens
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token[AUTH_TIME_CLAIM] = time.time()
         # ...
 
         return token
 
 
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    # Checks the blacklist in the cache, see apps.accounts.tokens
+    token_class = UserRefreshToken
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -50,6 +64,7 @@ class UserSerializer(serializers.ModelSerializer):
             'last_login': {'required': False},
             'date_joined': {'required': False},
             'password': {'write_only': True},
+            'avatar_renditions': {'read_only': True},
         }
 
     def validate_password(self, value):
@@ -86,7 +101,7 @@ class UserSerializer(serializers.ModelSerializer):
 
             if (
                 not user.is_superuser
-                and not user.groups.filter(permissions__codename='change_is_superuser').exists()
+                and not has_group_permission(user, 'change_is_superuser')
             ):
                 fields.pop('is_staff')
                 fields.pop('is_superuser')
@@ -142,33 +157,27 @@ class ChangePasswordSerializer(serializers.Serializer):
 class PasswordResetSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
-    def validate_email(self, value):
-        user = User.objects.filter(email=value).first()
-        if user is None:
-            raise serializers.ValidationError('User with this email does not exist')
-        return value
+    def validate(self, attrs):
+        # Looked up once, kept for save()
+        attrs['user'] = User.objects.filter(email=attrs['email']).first()
+        if attrs['user'] is None:
+            raise serializers.ValidationError({'email': 'User with this email does not exist'})
+        return attrs
 
     def save(self, **kwargs):
-        user = User.objects.get(email=self.validated_data['email'])
+        user = self.validated_data['user']
         token = default_token_generator.make_token(user)
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         reset_link = f'http://your-frontend-url/reset-password-confirm/{uid}/{token}/'
 
-        # Render email content
-        subject = 'Password Reset'
-        from_email = 'webmaster@example.com'
-        to_email = user.email
+        # Written to the outbox, rendered and sent by Celery (see common.mail)
         context = {
-            'user': user,
+            'full_name': user.get_full_name(),
             'reset_link': reset_link,
         }
-        text_content = render_to_string('email/password_reset_email.txt', context)
-        html_content = render_to_string('email/password_reset_email.html', context)
-
-        # Send email
-        email = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-        email.attach_alternative(html_content, 'text/html')
-        email.send()
+        return queue_email(
+            'emails/password_reset_email', context, [user.email], subject='Password Reset'
+        )
 
 
 class PasswordResetConfirmSerializer(serializers.Serializer):
@@ -1,65 +1,157 @@
-from django.db.models.signals import pre_save, pre_delete
+import logging
+from kombu.exceptions import OperationalError
+from django.contrib.auth.models import Group
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save, pre_delete
 from django.dispatch import receiver
-from django.core.files import File
 
-from rest_framework.serializers import ValidationError
-
-from PIL import Image
-from io import BytesIO
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
+from common.models.soft_delete_models import post_soft_delete
+from common.permissions import invalidate_all_permissions, invalidate_user_permissions
+from .authentication import revoke_user_tokens
 from .models import User
+from .tasks import process_avatar
+from .tokens import mark_token_revoked
+
+logger = logging.getLogger(__name__)
+
+# Changes that end the sessions of a user, the tokens carry or depend on these fields
+TOKEN_REVOKING_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser', 'is_deleted')
+
+
+def _stored_avatar(sender, instance):
+    """
+    The avatar and renditions of the row, from the values loaded with the instance
+    (see BaseModel.from_db), so there is no query unless it was not loaded.
+    """
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and 'avatar' in loaded:
+        # A name when loaded, a FieldFile when kept by BaseModel.save
+        avatar = loaded['avatar']
+        return getattr(avatar, 'name', avatar) or '', loaded.get('avatar_renditions') or {}
+
+    if instance._state.adding:
+        return '', {}
+    stored = sender.all_objects.filter(pk=instance.pk).values('avatar', 'avatar_renditions').first()
+    if stored is None:
+        return '', {}
+    return stored['avatar'] or '', stored['avatar_renditions'] or {}
 
 
 @receiver(pre_save, sender=User)
 def handle_avatar_update(sender, instance, **kwargs):
-    print('Triggerd user...handle_avatar_update')
     if instance.deleted_at is not None:
         # User is being soft deleted, do not process the avatar
         return
 
-    avatar_changed = False
-    if instance.pk:
-        try:
-            old_instance = sender.objects.only('avatar').get(pk=instance.pk)
-            avatar_changed = old_instance.avatar != instance.avatar
-            if avatar_changed and old_instance.avatar:
-                # Delete the old avatar
-                old_instance.avatar.delete(save=False)
-        except sender.DoesNotExist:
-            pass  # Old instance does not exist, this must be a new instance
-    else:
-        avatar_changed = bool(instance.avatar)  # New instance with an avatar
+    old_avatar, old_renditions = _stored_avatar(sender, instance)
 
-    if avatar_changed and instance.avatar:
-        compress_avatar(instance)
+    # A new upload is not in the storage yet, whatever its name
+    if (instance.avatar.name or '') == old_avatar and instance.avatar._committed:
+        instance._avatar_changed = False
+        return
 
+    instance._avatar_changed = True
+    instance._replaced_avatar_files = [old_avatar, *old_renditions.values()]
+    instance.avatar_renditions = {}
 
-def compress_avatar(instance):
-    try:
-        with Image.open(instance.avatar) as im:
-            img_format = im.format
-            if img_format not in ['JPEG', 'PNG']:
-                raise Exception(f'Unsupported image format: {img_format}')
 
-            # Save the compressed image to BytesIO object
-            im.thumbnail((400, 400))
-            im_io = BytesIO()
-            save_params = {'JPEG': ('JPEG', {'quality': 70}), 'PNG': ('PNG', {'optimize': True})}
-            save_format, save_kwargs = save_params[img_format]
-            im.save(im_io, save_format, **save_kwargs)
+@receiver(post_save, sender=User)
+def process_avatar_on_change(sender, instance, **kwargs):
+    if not getattr(instance, '_avatar_changed', False):
+        return
+    instance._avatar_changed = False
+
+    replaced = [name for name in instance._replaced_avatar_files if name]
+    avatar_name = instance.avatar.name
 
-            # Create a django-friendly File object
-            new_image = File(im_io, name=instance.avatar.name)
+    def after_commit():
+        for name in replaced:
+            default_storage.delete(name)
+        if not avatar_name:
+            return
+        try:
+            process_avatar.delay(instance.pk, avatar_name)
+        except OperationalError:
+            # The broker is unreachable, the avatar is served without renditions
+            logger.warning('Could not queue the processing of the avatar of user %s', instance.pk)
 
-            # Assign the compressed image back to the instance's avatar attribute
-            instance.avatar = new_image
-    except Exception as e:
-        raise ValidationError(f'Error compressing the image. {str(e)}')
+    transaction.on_commit(after_commit)
 
 
 @receiver(pre_delete, sender=User)
 def delete_user_avatar_on_delete(sender, instance, **kwargs):
-    print('Triggered user....delete_user_avatar_on_delete')
-    # User is being hard deleted, delete the avatar
+    # User is being hard deleted, delete the avatar and its renditions
     if instance.avatar:
         instance.avatar.delete(save=False)
+    for name in instance.avatar_renditions.values():
+        default_storage.delete(name)
+
+
+# The permissions are invalidated once the change commits, a request reading them before
+# would cache the permissions being replaced under the current version
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_permissions_on_user_groups_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        user_ids = [instance.pk]
+        transaction.on_commit(lambda: invalidate_user_permissions(user_ids))
+    elif pk_set is not None:
+        # group.user_set.add(...) and remove(...)
+        user_ids = list(pk_set)
+        transaction.on_commit(lambda: invalidate_user_permissions(user_ids))
+    else:
+        # group.user_set.clear(), the users are not known anymore
+        transaction.on_commit(invalidate_all_permissions)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions_on_group_permissions_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidate_all_permissions)
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_permissions_on_group_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_all_permissions)
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_user_change(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    # The values the row had before this save (see BaseModel.from_db)
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None or any(
+        field in loaded and loaded[field] != getattr(instance, field)
+        for field in TOKEN_REVOKING_FIELDS
+    ):
+        instance.tokens_revoked_at = revoke_user_tokens([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_user_delete(sender, instance, **kwargs):
+    revoke_user_tokens([instance.pk])
+
+
+@receiver(post_soft_delete, sender=User)
+def revoke_tokens_on_bulk_delete(sender, deleted_at, **kwargs):
+    revoke_user_tokens(
+        list(User.deleted_objects.filter(deleted_at=deleted_at).values_list('pk', flat=True))
+    )
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_blacklisted_token(sender, instance, created, **kwargs):
+    # Tokens blacklisted elsewhere than UserRefreshToken.blacklist, e.g. in the admin
+    if created:
+        mark_token_revoked(instance.token.jti, instance.token.expires_at)
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import time
+from io import BytesIO
+from celery import shared_task
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from common.media import store_content_etag
+from .models import User
+from .tokens import warm_revoked_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Sizes in pixels of the square boxes the avatar renditions fit in
+AVATAR_SIZES = (64, 128, 400)
+AVATAR_FORMAT, AVATAR_EXTENSION = 'WEBP', 'webp'
+
+FLUSH_BATCH_SIZE = 1000
+# Pause between two batches, to leave room to the sign-ins writing to the same table
+FLUSH_BATCH_PAUSE = 0.1
+
+
+@shared_task
+def flush_expired_tokens(batch_size=FLUSH_BATCH_SIZE, pause=FLUSH_BATCH_PAUSE):
+    """
+    Delete the expired outstanding tokens, and their blacklist rows, in short batches.
+
+    Same as simplejwt's flushexpiredtokens command, without one long DELETE locking the
+    tables. The cached revoked JTIs expire on their own (see apps.accounts.tokens).
+    """
+    now = timezone.now()
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk')
+
+    deleted = 0
+    last_pk = 0
+    while True:
+        pks = list(expired.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+
+        # The BlacklistedToken rows go with them (on_delete=CASCADE)
+        OutstandingToken.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        last_pk = pks[-1]
+        time.sleep(pause)
+
+    logger.info('Flushed %s expired tokens', deleted)
+    return {'tokens_flushed': deleted}
+
+
+@shared_task
+def cache_revoked_tokens():
+    """
+    Reload the cached copy of the token blacklist, in case entries were evicted.
+    """
+    count = warm_revoked_tokens()
+    logger.info('Cached %s revoked tokens', count)
+    return {'tokens_cached': count}
+
+
+@shared_task
+def process_avatar(user_id, avatar_name):
+    """
+    Write the renditions of an uploaded avatar, queued by apps.accounts.signals.
+
+    The image is decoded once at the largest size needed: JPEG is decoded straight at
+    a reduced scale (draft) and the smaller sizes are reduced from it. The renditions
+    are named after a hash of their content, so they can be cached for good, and the
+    hash of the avatar is recorded for its ETag (see common.media).
+    """
+    user = User.all_objects.filter(pk=user_id, avatar=avatar_name).first()
+    if user is None:
+        # Replaced or removed since it was queued
+        return None
+
+    largest = max(AVATAR_SIZES)
+    try:
+        avatar_digest = hashlib.sha256()
+        with user.avatar.open('rb'):
+            for chunk in user.avatar.chunks():
+                avatar_digest.update(chunk)
+
+        with user.avatar.open('rb'), Image.open(user.avatar) as im:
+            im.draft('RGB', (largest, largest))
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((largest, largest), reducing_gap=2.0)
+            if im.mode not in ('RGB', 'RGBA'):
+                im = im.convert('RGBA' if 'transparency' in im.info else 'RGB')
+
+            renditions = {}
+            for size in sorted(AVATAR_SIZES, reverse=True):
+                im.thumbnail((size, size), reducing_gap=2.0)
+                buffer = BytesIO()
+                im.save(buffer, AVATAR_FORMAT, quality=80, method=4)
+                content = buffer.getvalue()
+
+                # Per user, the renditions of a replaced avatar are deleted
+                digest = hashlib.sha256(content).hexdigest()[:16]
+                name = os.path.join(
+                    'profile_images',
+                    'renditions',
+                    str(user_id),
+                    f'{digest}_{size}.{AVATAR_EXTENSION}',
+                )
+                if not default_storage.exists(name):
+                    name = default_storage.save(name, ContentFile(content))
+                renditions[str(size)] = name
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Could not process the avatar %s of user %s: %s', avatar_name, user_id, e)
+        return None
+
+    # An UPDATE, the avatar may have been replaced meanwhile and no signal is needed
+    User.all_objects.filter(pk=user_id, avatar=avatar_name).update(avatar_renditions=renditions)
+    store_content_etag(avatar_name, avatar_digest.hexdigest()[:32])
+    return renditions
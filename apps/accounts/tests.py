@@ -1,3 +1,475 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+from datetime import timedelta
+from smtplib import SMTPException
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.signals import user_login_failed
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from common.mail import EMAIL_RETENTION, purge_sent, send_queued
+from common.models import OutboxEmail
+from common.permissions import has_group_permission
+from .models import User
+from .serializers import UserTokenObtainPairSerializer
+from .tasks import cache_revoked_tokens, process_avatar
+from .tokens import is_token_revoked
+
+
+class AccountsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@example.com', 'User', 'One', 'pw')
+
+    def setUp(self):
+        # The cache outlives the transaction of each test
+        cache.clear()
+
+
+class GroupPermissionCacheTests(AccountsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.permission = Permission.objects.get(codename='view_booking')
+        cls.group = Group.objects.create(name='Front desk')
+
+    def assertPermission(self, expected):
+        # A fresh instance, the permissions are cached by user id
+        user = User.objects.get(pk=self.user.pk)
+        self.assertIs(has_group_permission(user, 'view_booking'), expected)
+
+    def commit(self, change, *args):
+        # The permissions are invalidated once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            change(*args)
+
+    def test_group_permission_changes(self):
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(False)
+
+        self.commit(self.group.permissions.add, self.permission)
+        self.assertPermission(True)
+        self.commit(self.group.permissions.remove, self.permission)
+        self.assertPermission(False)
+        self.commit(self.group.permissions.add, self.permission)
+        self.assertPermission(True)
+        self.commit(self.group.permissions.clear)
+        self.assertPermission(False)
+
+    def test_user_group_changes(self):
+        self.commit(self.group.permissions.add, self.permission)
+        self.assertPermission(False)
+
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+        self.commit(self.user.groups.remove, self.group)
+        self.assertPermission(False)
+
+        self.commit(self.group.user_set.add, self.user)
+        self.assertPermission(True)
+        self.commit(self.group.user_set.remove, self.user)
+        self.assertPermission(False)
+
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+        self.commit(self.group.user_set.clear)
+        self.assertPermission(False)
+
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+        self.commit(self.user.groups.clear)
+        self.assertPermission(False)
+
+    def test_group_deleted(self):
+        self.commit(self.group.permissions.add, self.permission)
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+
+        self.commit(self.group.delete)
+        self.assertPermission(False)
+
+    def test_cached_until_changed(self):
+        self.commit(self.group.permissions.add, self.permission)
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+
+        with self.assertNumQueries(1):
+            # Only loading the user
+            self.assertPermission(True)
+
+    def test_invalidated_on_commit(self):
+        self.commit(self.group.permissions.add, self.permission)
+        self.commit(self.user.groups.add, self.group)
+        self.assertPermission(True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.remove(self.permission)
+            # Read before the commit, the permissions are cached under the current version
+            self.assertPermission(True)
+        self.assertPermission(False)
+
+
+class TokenRevocationTests(AccountsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', 'pw')
+
+    def sign_in(self):
+        refresh = UserTokenObtainPairSerializer.get_token(self.admin)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        return client
+
+    def assertAuthenticated(self, client, expected=True):
+        # A safe method authenticated from the token claims, and one loading the user
+        for path in ('/api/hotels/', '/api/auth/me/'):
+            status_code = client.get(path).status_code
+            self.assertEqual(status_code == 200, expected, path)
+            self.assertEqual(status_code == 401, not expected, path)
+
+    def test_token_accepted(self):
+        self.assertAuthenticated(self.sign_in())
+
+    def test_password_change(self):
+        client = self.sign_in()
+        self.assertAuthenticated(client)
+
+        self.admin.set_password('new')
+        self.admin.save()
+        self.assertAuthenticated(client, False)
+        # The tokens of a later sign-in are not revoked
+        self.assertAuthenticated(self.sign_in())
+
+    def test_deactivation(self):
+        client = self.sign_in()
+        self.assertAuthenticated(client)
+
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertAuthenticated(client, False)
+
+    def test_deactivation_without_signal(self):
+        client = self.sign_in()
+        self.assertAuthenticated(client)
+
+        User.objects.filter(pk=self.admin.pk).update(is_active=False)
+        # Seen once the cached state expires
+        cache.clear()
+        self.assertAuthenticated(client, False)
+
+    def test_deletion(self):
+        client = self.sign_in()
+        User.objects.filter(pk=self.admin.pk).delete()
+        self.assertAuthenticated(client, False)
+
+        client = self.sign_in()
+        User.all_objects.get(pk=self.admin.pk).hard_delete()
+        self.assertAuthenticated(client, False)
+
+    def test_revocation_outlives_the_cache(self):
+        client = self.sign_in()
+        self.admin.set_password('new')
+        self.admin.save()
+
+        cache.clear()
+        self.assertAuthenticated(client, False)
+
+    def test_stale_instance_save(self):
+        client = self.sign_in()
+        stale = User.objects.get(pk=self.admin.pk)
+
+        self.admin.set_password('new')
+        self.admin.save()
+        stale.first_name = 'Renamed'
+        stale.save()
+
+        cache.clear()
+        self.assertAuthenticated(client, False)
+
+
+class TokenBlacklistTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.refresh = UserTokenObtainPairSerializer.get_token(self.user)
+        self.client = APIClient()
+
+    def refresh_token(self):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': str(self.refresh)})
+
+    def log_out(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        response = self.client.post('/api/auth/logout/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 204)
+        self.client.credentials()
+
+    def test_refresh(self):
+        self.assertEqual(self.refresh_token().status_code, 200)
+        # The negative lookup is cached too
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh_token().status_code, 200)
+
+    def test_refresh_after_logout(self):
+        self.assertEqual(self.refresh_token().status_code, 200)
+        self.log_out()
+        self.assertEqual(self.refresh_token().status_code, 401)
+
+    def test_refresh_after_logout_and_cache_flush(self):
+        self.log_out()
+        cache.clear()
+        self.assertEqual(self.refresh_token().status_code, 401)
+
+    def test_cache_revoked_tokens(self):
+        self.log_out()
+        cache.clear()
+
+        self.assertEqual(cache_revoked_tokens(), {'tokens_cached': 1})
+        with self.assertNumQueries(0):
+            self.assertIs(is_token_revoked(self.refresh['jti']), True)
+
+
+class SignInTests(TransactionTestCase):
+    # The authentication backends run in the threads of the hashing pool, on their own
+    # database connections, which would not see the rows of a test transaction
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user@example.com', 'User', 'One', 'pw')
+        self.client = APIClient()
+
+    def sign_in(self, email='user@example.com', password='pw'):
+        return self.client.post(
+            '/api/auth/signin/', {'email': email, 'password': password}, format='json'
+        )
+
+    def test_signed_in(self):
+        response = self.sign_in(email='user@EXAMPLE.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_id'], self.user.pk)
+        self.assertIn('hash;dur=', response['Server-Timing'])
+
+    def test_rejected(self):
+        failures = mock.Mock()
+        user_login_failed.connect(failures)
+        self.addCleanup(user_login_failed.disconnect, failures)
+
+        self.assertEqual(self.sign_in(password='wrong').status_code, 401)
+        self.assertEqual(self.sign_in(email='nobody@example.com').status_code, 401)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.sign_in().status_code, 401)
+
+        self.assertEqual(failures.call_count, 3)
+        # With the password cleansed
+        self.assertNotEqual(failures.call_args.kwargs['credentials']['password'], 'pw')
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ]
+    )
+    def test_outdated_hash_upgraded(self):
+        self.user.password = make_password('pw', hasher='md5')
+        self.user.save()
+
+        self.assertEqual(self.sign_in().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+
+def image_file(size=(32, 32)):
+    # Noise, so the file size grows with the dimensions
+    buffer = BytesIO()
+    Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)).save(buffer, 'PNG')
+    return SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+
+class MediaTestCase(AccountsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+
+
+class AvatarUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, file):
+        return self.client.patch('/api/auth/me/', {'avatar': file}, format='multipart')
+
+    def assertRejected(self, file, message):
+        response = self.upload(file)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, response.json()['avatar'][0])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_valid_image(self):
+        response = self.upload(image_file())
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.endswith('.png'))
+
+    def test_oversize(self):
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024):
+            self.assertRejected(image_file((100, 100)), 'File size cannot exceed')
+
+    def test_not_an_image(self):
+        file = SimpleUploadedFile('avatar.png', b'not an image', content_type='image/png')
+        self.assertRejected(file, 'Invalid image format')
+
+    def test_truncated(self):
+        file = SimpleUploadedFile('avatar.png', image_file().read()[:20], content_type='image/png')
+        self.assertRejected(file, 'corrupted')
+
+    def test_too_many_pixels(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 32 * 32):
+            # Over twice the limit Pillow refuses to open it, under it only warns
+            self.assertRejected(image_file((64, 64)), 'Image dimensions cannot exceed')
+            with self.assertWarns(Image.DecompressionBombWarning):
+                self.assertRejected(image_file((33, 32)), 'Image dimensions cannot exceed')
+
+
+@override_settings(MEDIA_DELIVERY='x-accel-redirect')
+class MediaDeliveryTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        file = image_file()
+        self.avatar_etag = f'"{hashlib.sha256(file.read()).hexdigest()[:32]}"'
+        self.user.avatar.save('avatar.png', file)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', headers=headers)
+
+    def test_accel_redirect(self):
+        response = self.get(self.user.avatar.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.user.avatar.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_avatar_etag(self):
+        # Not hashed on a request, weak until the task records the hash
+        with mock.patch('hashlib.sha256') as sha256:
+            response = self.get(self.user.avatar.name)
+        sha256.assert_not_called()
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        process_avatar(self.user.pk, self.user.avatar.name)
+        response = self.get(self.user.avatar.name)
+        self.assertEqual(response['ETag'], self.avatar_etag)
+
+        response = self.get(self.user.avatar.name, if_none_match=self.avatar_etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    def test_rendition_etag(self):
+        renditions = process_avatar(self.user.pk, self.user.avatar.name)
+        name = renditions['64']
+        digest = os.path.basename(name).split('_')[0]
+
+        response = self.get(name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.get(name, if_none_match=f'"{digest}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_found(self):
+        self.assertEqual(self.get('profile_images/missing.png').status_code, 404)
+        self.assertEqual(self.get('profile_images').status_code, 404)
+
+
+class PasswordResetEmailTests(AccountsTestCase):
+    def request_reset(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('common.tasks.send_queued_emails.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post('/api/auth/reset-password/', {'email': self.user.email})
+        self.assertEqual(response.status_code, 200)
+        delay.assert_called_once_with()
+        return OutboxEmail.objects.latest('pk')
+
+    def test_sent(self):
+        email = self.request_reset()
+        self.assertEqual(mail.outbox, [])
+        self.assertIn('reset_link', email.context)
+
+        self.assertEqual(send_queued(), {'sent': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertIn(email.context['reset_link'], mail.outbox[0].body)
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.SENT)
+        # The reset link is not kept
+        self.assertEqual(email.context, {})
+        self.assertEqual(send_queued(), {})
+
+    def test_send_failure(self):
+        email = self.request_reset()
+        send = mock.patch('common.mail.EmailMultiAlternatives.send', side_effect=SMTPException)
+        with send, self.assertLogs('common.mail', 'WARNING'):
+            self.assertEqual(send_queued(), {'retrying': 1})
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Not due before the backoff
+        self.assertEqual(send_queued(), {})
+
+    def test_backend_unreachable(self):
+        email = self.request_reset()
+        with mock.patch('common.mail.get_connection', side_effect=OSError):
+            with self.assertRaises(OSError):
+                send_queued()
+
+        # Put back as it was, for the retry of the task
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 0)
+        self.assertEqual(send_queued(), {'sent': 1})
+
+    def test_expired_claim(self):
+        email = self.request_reset()
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            status=OutboxEmail.Status.SENDING, next_attempt_at=timezone.now() + timedelta(minutes=1)
+        )
+        # Claimed by another worker
+        self.assertEqual(send_queued(), {})
+
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued(), {'sent': 1})
+
+    def test_purge_sent(self):
+        old, recent, pending = [self.request_reset() for _ in range(3)]
+        send_queued()
+        OutboxEmail.objects.filter(pk=old.pk).update(
+            sent_at=timezone.now() - EMAIL_RETENTION - timedelta(minutes=1)
+        )
+        OutboxEmail.objects.filter(pk=pending.pk).update(status=OutboxEmail.Status.PENDING)
+
+        self.assertEqual(purge_sent(), 1)
+        self.assertQuerysetEqual(
+            OutboxEmail.objects.order_by('pk'), [recent, pending], transform=lambda email: email
+        )
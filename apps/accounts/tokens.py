@@ -0,0 +1,75 @@
+"""
+Refresh tokens checked against a cached copy of the token blacklist.
+
+The blacklist tables stay the source of truth. Whether a JTI is blacklisted is kept in
+the cache, until the token expires when it is and briefly when it is not, so a refresh
+only joins the blacklist tables on a cache miss. The blacklisted tokens are reloaded
+into the cache by apps.accounts.tasks.cache_revoked_tokens, e.g. after a cache flush.
+"""
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+# Seconds a JTI is known not to be blacklisted, blacklisting it overwrites the entry
+NOT_REVOKED_CACHE_TIMEOUT = 60
+
+
+def _revoked_token_key(jti):
+    return f'accounts:revoked_tokens:{jti}'
+
+
+def mark_token_revoked(jti, expires_at):
+    timeout = (expires_at - timezone.now()).total_seconds()
+    if timeout > 0:
+        cache.set(_revoked_token_key(jti), True, timeout=timeout)
+
+
+def warm_revoked_tokens():
+    """
+    Copy the blacklisted tokens that have not expired yet to the cache.
+    """
+    revoked = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list(
+        'token__jti', 'token__expires_at'
+    )
+    count = 0
+    for jti, expires_at in revoked.iterator():
+        mark_token_revoked(jti, expires_at)
+        count += 1
+    return count
+
+
+def is_token_revoked(jti):
+    revoked = cache.get(_revoked_token_key(jti))
+    if revoked is not None:
+        return revoked
+
+    expires_at = (
+        BlacklistedToken.objects.filter(token__jti=jti)
+        .values_list('token__expires_at', flat=True)
+        .first()
+    )
+    if expires_at is not None:
+        mark_token_revoked(jti, expires_at)
+        return True
+    # Not over a token blacklisted meanwhile
+    cache.add(_revoked_token_key(jti), False, timeout=NOT_REVOKED_CACHE_TIMEOUT)
+    return False
+
+
+class UserRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if is_token_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        # Already blacklisted rows send no post_save, see apps.accounts.signals
+        mark_token_revoked(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self['exp']))
+        return blacklisted
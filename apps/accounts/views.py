@@ -1,3 +1,4 @@
+import json
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.generics import (
@@ -9,13 +10,15 @@ from rest_framework.generics import (
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.authentication import SessionAuthentication
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import Group, Permission
-from django.http import Http404
+from django.http import Http404, JsonResponse
+from django.views import View
 from django.contrib.auth import logout as django_logout
 
+from .authentication import DatabaseUserJWTAuthentication
 from .models import User
 from .serializers import (
     GroupSerializer,
@@ -27,25 +30,71 @@ from .serializers import (
     PasswordResetSerializer,
     PasswordResetConfirmSerializer,
 )
+from common.mixins import ImageUploadGuardMixin
 from common.viewsets.base_viewsets import BaseModelViewSet
 from .permissions import UserPermissions
-
-
-class UserTokenObtainPairView(TokenObtainPairView):
-    serializer_class = UserTokenObtainPairSerializer
-
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        serializer = self.serializer_class(data=request.data)
-
-        if serializer.is_valid():
-            # Retrieve the user from the serializer
-            user = serializer.user
-
-            # Add custom claims to the response data
-            response.data['user_id'] = user.id
-            response.data['email'] = user.email
-
+from .signin import verify_credentials
+from .tokens import UserRefreshToken
+
+
+class UserTokenObtainPairView(View):
+    """
+    Sign-in: the credentials are verified once, the password hashed off the event loop.
+
+    A plain async Django view, DRF views are sync only. The response matches the one of
+    simplejwt's TokenObtainPairView with the `user_id` and `email` of the user.
+    """
+
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authentication, no session to protect
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request, *args, **kwargs):
+        data = request.POST
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return JsonResponse(
+                    {'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+        errors = {
+            field: ['This field is required.']
+            for field in (User.USERNAME_FIELD, 'password')
+            if not isinstance(data.get(field), str) or not data.get(field)
+        }
+        if errors:
+            return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user, timings = await verify_credentials(
+            request, data[User.USERNAME_FIELD], data['password']
+        )
+        if user is None:
+            response = JsonResponse(
+                {'detail': 'No active account found with the given credentials'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        else:
+            # Writes the OutstandingToken row of the refresh token
+            refresh = await sync_to_async(UserTokenObtainPairSerializer.get_token)(user)
+            response = JsonResponse(
+                {
+                    'refresh': str(refresh),
+                    'access': str(refresh.access_token),
+                    'user_id': user.id,
+                    'email': user.email,
+                }
+            )
+
+        response['Server-Timing'] = timings.server_timing()
         return response
 
 
@@ -55,19 +104,22 @@ class UserRegisterView(CreateAPIView):
     serializer_class = UserRegisterSerializer
 
 
-class UserMeView(RetrieveUpdateAPIView):
+class UserMeView(ImageUploadGuardMixin, RetrieveUpdateAPIView):
     # authentication_classes = [SessionAuthentication, BasicAuthentication]
+    authentication_classes = [DatabaseUserJWTAuthentication, SessionAuthentication]
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    image_upload_fields = ('avatar',)
 
     def get_object(self):
         return self.request.user
 
 
-class UserViewSet(BaseModelViewSet):
+class UserViewSet(ImageUploadGuardMixin, BaseModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [UserPermissions]
+    image_upload_fields = ('avatar',)
 
     def get_queryset(self):
         # For normal operations, use the default queryset
@@ -132,7 +184,7 @@ class LogoutView(APIView):
         try:
             refresh_token = request.data.get('refresh')
             if refresh_token:
-                token = RefreshToken(refresh_token)
+                token = UserRefreshToken(refresh_token)
                 token.blacklist()
         except Exception:
             pass
@@ -19,6 +19,7 @@ from apps.hotel.views import (
     StaffViewSet,
     GuestViewSet,
     RoomTypeViewSet,
+    RoomRateViewSet,
     RoomViewSet,
     BookingViewSet,
     PaymentViewSet,
@@ -46,6 +47,7 @@ router.register(r'hotels', HotelViewSet)
 router.register(r'staff', StaffViewSet)
 router.register(r'guests', GuestViewSet)
 router.register(r'room-types', RoomTypeViewSet)
+router.register(r'room-rates', RoomRateViewSet)
 router.register(r'rooms', RoomViewSet)
 router.register(r'bookings', BookingViewSet)
 router.register(r'payments', PaymentViewSet)
@@ -25,6 +25,7 @@ class APIRootView(APIView):
             'staff': reverse('api:staff-list', request=request, format=None),
             'guests': reverse('api:guest-list', request=request, format=None),
             'room-types': reverse('api:roomtype-list', request=request, format=None),
+            'room-rates': reverse('api:roomrate-list', request=request, format=None),
             'rooms': reverse('api:room-list', request=request, format=None),
             'bookings': reverse('api:booking-list', request=request, format=None),
             'payments': reverse('api:payment-list', request=request, format=None),
@@ -0,0 +1,180 @@
+"""
+Hotel KPIs (occupancy, ADR, RevPAR) computed with vectorized NumPy operations.
+
+The bookings overlapping the range are loaded once as flat arrays, expanded into a
+room-by-day occupancy matrix with difference arrays and cumulative sums, and reduced
+per hotel. No Python loop runs per booking or per night.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+from .models import Booking, Room
+
+
+def epoch_days(dates):
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+@dataclass
+class BookingIntervals:
+    """
+    Bookings as parallel arrays, dates as days since the Unix epoch.
+    """
+
+    room_ids: np.ndarray
+    check_in: np.ndarray
+    check_out: np.ndarray
+    total_price: np.ndarray
+
+
+def load_booking_intervals(start_date, end_date, hotel=None):
+    bookings = Booking.objects.filter(
+        check_in_date__lte=end_date,
+        check_out_date__gt=start_date,
+    )
+    if hotel is not None:
+        bookings = bookings.filter(room__hotel=hotel)
+
+    rows = list(
+        bookings.values_list('room_id', 'check_in_date', 'check_out_date', 'total_price')
+    )
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return BookingIntervals(empty, empty, empty, np.empty(0, dtype=np.float64))
+
+    room_ids, check_in, check_out, total_price = zip(*rows)
+    return BookingIntervals(
+        room_ids=np.array(room_ids, dtype=np.int64),
+        check_in=epoch_days(check_in),
+        check_out=epoch_days(check_out),
+        total_price=np.array(total_price, dtype=np.float64),
+    )
+
+
+def load_rooms(hotel=None):
+    """
+    Live rooms as (room ids, hotel ids) arrays.
+    """
+    rooms = Room.objects.all()
+    if hotel is not None:
+        rooms = rooms.filter(hotel=hotel)
+
+    rows = np.array(list(rooms.values_list('id', 'hotel_id')), dtype=np.int64).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def _day_counts(row_index, first_day, last_day, n_rows, n_days, weights=None):
+    """
+    (row, day) matrix where each interval [first_day, last_day) of `row_index` adds its
+    weight (1 by default) to every day it covers.
+
+    Every interval adds its weight at its first day and removes it after its last one;
+    the cumulative sum of this difference matrix along the days gives the coverage.
+    """
+    size = n_rows * (n_days + 1)
+    starts = row_index * (n_days + 1) + first_day
+    ends = row_index * (n_days + 1) + last_day
+    diff = np.bincount(starts, weights, minlength=size) - np.bincount(ends, weights, minlength=size)
+    return np.cumsum(diff.reshape(n_rows, n_days + 1)[:, :n_days], axis=1)
+
+
+def occupancy_matrix(room_index, first_night, last_night, n_rooms, n_days):
+    """
+    Boolean (room, day) matrix of the nights covered by the stays.
+    """
+    return _day_counts(room_index, first_night, last_night, n_rooms, n_days) > 0
+
+
+def compute_kpis(intervals, room_ids, room_hotel_ids, start_day, n_days):
+    """
+    Occupancy, ADR and RevPAR per hotel and per day.
+
+    Returns the sorted hotel ids, the number of rooms of each hotel and (hotel, day)
+    arrays of occupied rooms, room revenue, occupancy, ADR and RevPAR. The revenue of
+    a stay is spread evenly over its nights.
+    """
+    # Rooms sorted by hotel, then id, so the rows of a hotel are contiguous
+    order = np.lexsort((room_ids, room_hotel_ids))
+    room_ids = room_ids[order]
+    hotels, room_hotel_index = np.unique(room_hotel_ids[order], return_inverse=True)
+    rooms_per_hotel = np.bincount(room_hotel_index, minlength=len(hotels))
+
+    # Map the booked rooms to their rows, dropping the rooms outside the selection
+    by_id = np.argsort(room_ids)
+    position = np.searchsorted(room_ids, intervals.room_ids, sorter=by_id)
+    position = by_id[np.minimum(position, max(len(room_ids) - 1, 0))]
+    known = (len(room_ids) > 0) & (room_ids[position] == intervals.room_ids)
+
+    room_index = position[known]
+    nights = intervals.check_out[known] - intervals.check_in[known]
+    nightly_rate = intervals.total_price[known] / np.maximum(nights, 1)
+    first_night = np.clip(intervals.check_in[known] - start_day, 0, n_days)
+    last_night = np.clip(intervals.check_out[known] - start_day, 0, n_days)
+
+    occupied = occupancy_matrix(room_index, first_night, last_night, len(room_ids), n_days)
+
+    # Sum the contiguous room rows of each hotel
+    if len(hotels):
+        boundaries = np.concatenate(([0], np.cumsum(rooms_per_hotel)[:-1]))
+        occupied_rooms = np.add.reduceat(occupied.astype(np.int64), boundaries, axis=0)
+    else:
+        occupied_rooms = np.zeros((0, n_days), dtype=np.int64)
+
+    revenue = _day_counts(
+        room_hotel_index[room_index], first_night, last_night, len(hotels), n_days, nightly_rate
+    )
+
+    available = rooms_per_hotel[:, np.newaxis].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupancy = occupied_rooms / available
+        adr = revenue / occupied_rooms
+        revpar = revenue / available
+
+    return {
+        'hotels': hotels,
+        'rooms': rooms_per_hotel,
+        'occupied_rooms': occupied_rooms,
+        'revenue': revenue,
+        'occupancy': occupancy,
+        'adr': adr,
+        'revpar': revpar,
+    }
+
+
+def _as_list(values):
+    return [None if np.isnan(value) else round(float(value), 2) for value in values]
+
+
+def hotel_kpis(start_date, end_date, hotel=None):
+    """
+    KPIs of the nights from `start_date` to `end_date` (inclusive), one entry per hotel.
+    """
+    n_days = (end_date - start_date).days + 1
+    room_ids, room_hotel_ids = load_rooms(hotel)
+    intervals = load_booking_intervals(start_date, end_date, hotel)
+    kpis = compute_kpis(
+        intervals, room_ids, room_hotel_ids, int(epoch_days([start_date])[0]), n_days
+    )
+
+    results = []
+    for index, hotel_id in enumerate(kpis['hotels']):
+        room_nights = int(kpis['rooms'][index]) * n_days
+        sold = int(kpis['occupied_rooms'][index].sum())
+        revenue = float(kpis['revenue'][index].sum())
+        results.append(
+            {
+                'hotel': int(hotel_id),
+                'rooms': int(kpis['rooms'][index]),
+                'occupancy': _as_list(kpis['occupancy'][index] * 100),
+                'adr': _as_list(kpis['adr'][index]),
+                'revpar': _as_list(kpis['revpar'][index]),
+                'totals': {
+                    'room_nights_sold': sold,
+                    'revenue': round(revenue, 2),
+                    'occupancy': round(sold / room_nights * 100, 2) if room_nights else None,
+                    'adr': round(revenue / sold, 2) if sold else None,
+                    'revpar': round(revenue / room_nights, 2) if room_nights else None,
+                },
+            }
+        )
+    return results
@@ -0,0 +1,89 @@
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+from .models import Booking, Room
+
+
+def overlapping_bookings(room, check_in_date, check_out_date, exclude=None):
+    """
+    Return the bookings of `room` whose stay overlaps [check_in_date, check_out_date).
+
+    Stays are half-open intervals, so a booking checking out on the day another one
+    checks in does not overlap it. The filter is a single range scan on the
+    (room, check_out_date, check_in_date) index of `Booking`, from the first stay
+    ending after `check_in_date`.
+    """
+    bookings = Booking.objects.filter(
+        room=room,
+        check_in_date__lt=check_out_date,
+        check_out_date__gt=check_in_date,
+    )
+    if exclude is not None:
+        bookings = bookings.exclude(pk=exclude.pk)
+    return bookings
+
+
+def is_room_available(room, check_in_date, check_out_date, exclude=None):
+    return not overlapping_bookings(room, check_in_date, check_out_date, exclude).exists()
+
+
+def occupied_at(moment):
+    """
+    Subquery matching the rooms that are occupied at `moment`.
+
+    A room is occupied from its check-in date until the hotel's check-out time on
+    the check-out date.
+    """
+    moment = timezone.localtime(moment)
+    today = moment.date()
+
+    return Exists(
+        Booking.objects.filter(
+            Q(check_out_date__gt=today)
+            | Q(check_out_date=today, room__hotel__check_out_time__gt=moment.time()),
+            room=OuterRef('pk'),
+            check_in_date__lte=today,
+        )
+    )
+
+
+def refresh_room_status(room_ids=None):
+    """
+    Recompute the cached `Room.status` flag as "occupied now" with one UPDATE.
+
+    `room_ids` may be an iterable of ids or a subquery returning them.
+    """
+    rooms = Room.objects.all()
+    if room_ids is not None:
+        rooms = rooms.filter(pk__in=room_ids)
+
+    return rooms.update(
+        status=Case(
+            When(occupied_at(timezone.now()), then=Value(Room.OCCUPIED)),
+            default=Value(Room.AVAILABLE),
+        )
+    )
+
+
+def available_rooms(check_in_date, check_out_date, hotel=None, room_type=None, capacity=None):
+    """
+    Rooms that are free for the whole stay, with their room type.
+
+    The bookings are anti-joined with NOT EXISTS and the room type is joined in, so
+    the search is a single query whatever the number of candidate rooms.
+    """
+    rooms = Room.objects.filter(room_type__is_deleted=False).select_related('room_type')
+
+    if hotel is not None:
+        rooms = rooms.filter(hotel=hotel)
+    if room_type is not None:
+        rooms = rooms.filter(room_type=room_type)
+    if capacity is not None:
+        rooms = rooms.filter(room_type__capacity__gte=capacity)
+
+    booked = Booking.objects.filter(
+        room=OuterRef('pk'),
+        check_in_date__lt=check_out_date,
+        check_out_date__gt=check_in_date,
+    )
+
+    return rooms.filter(~Exists(booked)).order_by('room_number')
@@ -0,0 +1,50 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from apps.hotel.analytics import BookingIntervals, compute_kpis
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the KPI computation of apps.hotel.analytics on synthetic bookings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1_000_000)
+        parser.add_argument('--rooms', type=int, default=20_000)
+        parser.add_argument('--hotels', type=int, default=50)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n_bookings = options['bookings']
+        n_days = options['days']
+
+        room_ids = np.arange(1, options['rooms'] + 1, dtype=np.int64)
+        room_hotel_ids = rng.integers(1, options['hotels'] + 1, size=len(room_ids))
+
+        # Stays of 1 to 14 nights, some starting before or ending after the range
+        check_in = rng.integers(-14, n_days, size=n_bookings)
+        nights = rng.integers(1, 15, size=n_bookings)
+        intervals = BookingIntervals(
+            room_ids=rng.choice(room_ids, size=n_bookings),
+            check_in=check_in,
+            check_out=check_in + nights,
+            total_price=nights * rng.uniform(50, 500, size=n_bookings).round(2),
+        )
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            kpis = compute_kpis(intervals, room_ids, room_hotel_ids, 0, n_days)
+            timings.append(time.perf_counter() - started)
+
+        self.stdout.write(
+            f'{n_bookings} bookings, {len(room_ids)} rooms, {len(kpis["hotels"])} hotels, '
+            f'{n_days} days'
+        )
+        self.stdout.write(
+            f'compute_kpis: best {min(timings) * 1000:.1f}ms, '
+            f'mean {sum(timings) / len(timings) * 1000:.1f}ms over {len(timings)} runs'
+        )
+        self.stdout.write(f'mean occupancy: {np.nanmean(kpis["occupancy"]) * 100:.1f}%')
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0002_alter_roomtype_description'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'check_out_date', 'check_in_date'], name='hotel_booki_room_id_518f38_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0004_daily_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_rate_room_type', to='hotel.roomtype')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomrate',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('room_type', 'date'), name='unique_room_rate_per_date'),
+        ),
+    ]
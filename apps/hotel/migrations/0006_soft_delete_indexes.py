@@ -0,0 +1,77 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0005_room_rate_calendar'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_booking_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_booking_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_guest_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_guest_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_hotel_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_hotel_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_payment_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_payment_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_room_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_room_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomrate',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_roomrate_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomrate',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_roomrate_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomtype',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_roomtype_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomtype',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_roomtype_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', 'id'], name='hotel_staff_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['-updated_at', 'id'], name='hotel_staff_deleted_idx'),
+        ),
+    ]
@@ -64,6 +64,30 @@ class RoomType(BaseModel):
         return self.name
 
 
+class RoomRate(BaseModel):
+    """
+    Nightly price of a room type on a given date, overriding `RoomType.price_per_night`.
+    """
+
+    room_type = models.ForeignKey(
+        RoomType, on_delete=models.CASCADE, related_name='room_rate_room_type'
+    )
+    date = models.DateField()
+    price = models.DecimalField(max_digits=9, decimal_places=2)
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['room_type', 'date'],
+                condition=models.Q(is_deleted=False),
+                name='unique_room_rate_per_date',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.room_type} on {self.date}: {self.price}'
+
+
 class Room(BaseModel):
     AVAILABLE = 'available'
     OCCUPIED = 'occupied'
@@ -73,6 +97,10 @@ class Room(BaseModel):
         (OCCUPIED, 'Occupied'),
     ]
 
+    # NOTE: `status` is a cached view of "occupied today", derived from the bookings
+    # by apps.hotel.availability.refresh_room_status. Use the availability module to
+    # check whether a room can be booked for a given date range.
+
     hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='room_hotel')
     room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name='room_type')
     room_number = models.CharField(max_length=15, unique=True)
@@ -89,6 +117,15 @@ class Booking(BaseModel):
     check_out_date = models.DateField()
     total_price = models.DecimalField(max_digits=9, decimal_places=2, default=0)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            *BaseModel.Meta.indexes,
+            # Serves the overlap check in apps.hotel.availability as one range scan:
+            # `check_out_date > start` seeks to the stays not over yet, a short tail
+            # whatever the history of the room
+            models.Index(fields=['room', 'check_out_date', 'check_in_date']),
+        ]
+
     def __str__(self):
         return f'{self.guest} booking for {self.room}'
 
@@ -103,9 +140,10 @@ class Booking(BaseModel):
         if self.check_in_date < timezone.now().date():
             raise ValidationError({'check_in_date': _('Check-in date cannot be in the past.')})
 
-    def save(self, *args, **kwargs):
-        # Validate the model
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        # Validate the model, unless the caller already did (see apps.hotel.services)
+        if validate:
+            self.full_clean()
         super().save(*args, **kwargs)
 
 
@@ -128,3 +166,49 @@ class Payment(BaseModel):
     payment_method = models.CharField(
         max_length=20, choices=PAYMENT_METHOD_CHOICES, default=PAYMENT_METHOD_CASH
     )
+
+
+class DailyRevenue(models.Model):
+    """
+    Bookings of a day per hotel and room type, attributed to their check-in date.
+
+    Maintained incrementally by apps.hotel.rollups and re-derived every night.
+    """
+
+    date = models.DateField()
+    # No reverse accessors, the rollups are not part of the soft delete cascade
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='+')
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name='+')
+    bookings = models.IntegerField(default=0)
+    room_nights = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'hotel', 'room_type'], name='unique_daily_revenue'
+            ),
+        ]
+
+
+class DailyPaymentTotal(models.Model):
+    """
+    Payments of a day per hotel, room type and payment method.
+
+    Maintained incrementally by apps.hotel.rollups and re-derived every night.
+    """
+
+    date = models.DateField()
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='+')
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name='+')
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES)
+    payments = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'hotel', 'room_type', 'payment_method'],
+                name='unique_daily_payment_total',
+            ),
+        ]
@@ -0,0 +1,86 @@
+"""
+Rate calendar lookups with an in-process cache of price arrays per room type.
+
+The nightly rates of a room type are loaded once into a dense array of cents covering
+the dates that have a rate (-1 where there is none), so pricing a stay is a slice and a
+vectorized sum instead of a query per night. A version number kept in the shared cache
+is bumped once an edit of a rate of the room type commits, which makes every process
+reload its copy on the next lookup.
+"""
+
+from decimal import Decimal
+import threading
+from django.db import transaction
+import numpy as np
+from common.cache import bump_cache_version, cache_version
+from .models import RoomRate
+
+
+NO_RATE = -1
+
+_calendars = {}
+_lock = threading.Lock()
+
+
+def _version_key(room_type_id):
+    return f'hotel:room_rates:version:{room_type_id}'
+
+
+def invalidate_room_rates(room_type_id):
+    # Bumped before the commit, another process could reload the rates being replaced
+    # and keep them under the new version
+    transaction.on_commit(lambda: bump_cache_version(_version_key(room_type_id)))
+
+
+def _load_calendar(room_type_id):
+    """
+    (first date ordinal, cents per night) of the rates of the room type.
+    """
+    rates = list(
+        RoomRate.objects.filter(room_type_id=room_type_id)
+        .order_by('date')
+        .values_list('date', 'price')
+    )
+    if not rates:
+        return 0, np.empty(0, dtype=np.int64)
+
+    first = rates[0][0].toordinal()
+    cents = np.full(rates[-1][0].toordinal() - first + 1, NO_RATE, dtype=np.int64)
+    for date, price in rates:
+        cents[date.toordinal() - first] = int(price * 100)
+    return first, cents
+
+
+def _calendar(room_type_id):
+    version = cache_version(_version_key(room_type_id))
+    entry = _calendars.get(room_type_id)
+    if entry is None or entry[0] != version:
+        with _lock:
+            entry = (version, *_load_calendar(room_type_id))
+            _calendars[room_type_id] = entry
+    return entry[1], entry[2]
+
+
+def nightly_prices(room_type, check_in_date, check_out_date):
+    """
+    Price in cents of every night of the stay, as an array.
+    """
+    start = check_in_date.toordinal()
+    nights = check_out_date.toordinal() - start
+    prices = np.full(nights, int(room_type.price_per_night * 100), dtype=np.int64)
+
+    first, cents = _calendar(room_type.pk)
+    # Overlap of the stay with the calendar, in calendar positions
+    lower = max(start - first, 0)
+    upper = min(start + nights - first, len(cents))
+    if lower < upper:
+        rates = cents[lower:upper]
+        offset = first + lower - start
+        window = prices[offset : offset + len(rates)]
+        prices[offset : offset + len(rates)] = np.where(rates == NO_RATE, window, rates)
+    return prices
+
+
+def stay_price(room_type, check_in_date, check_out_date):
+    cents = int(nightly_prices(room_type, check_in_date, check_out_date).sum())
+    return (Decimal(cents) / 100).quantize(Decimal('0.01'))
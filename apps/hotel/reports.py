@@ -0,0 +1,182 @@
+import csv
+import json
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import (
+    CharField,
+    Count,
+    DateField,
+    DurationField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FilteredRelation,
+    IntegerField,
+    OuterRef,
+    Q,
+    Sum,
+    Value,
+)
+from django.db.models.functions import TruncMonth
+from rest_framework.exceptions import ValidationError
+from common.renderers import Echo
+from .models import Payment
+
+
+BOOKING_REPORT_FIELDS = (
+    'guest__first_name',
+    'guest__last_name',
+    'room__room_number',
+    'check_in_date',
+    'check_out_date',
+    'total_price',
+)
+
+# Rows fetched per round trip by the server-side cursor
+BOOKING_REPORT_CHUNK_SIZE = 2000
+
+
+def _report_rows(bookings, totals):
+    """
+    Yield the report rows one at a time, accumulating the totals on the way.
+    """
+    price_index = BOOKING_REPORT_FIELDS.index('total_price')
+    rows = bookings.values_list(*BOOKING_REPORT_FIELDS).iterator(
+        chunk_size=BOOKING_REPORT_CHUNK_SIZE
+    )
+
+    for row in rows:
+        totals['total_bookings'] += 1
+        totals['total_sum'] += row[price_index]
+        yield row
+
+
+def stream_booking_report_csv(bookings):
+    totals = {'total_bookings': 0, 'total_sum': Decimal(0)}
+    writer = csv.writer(Echo())
+
+    yield writer.writerow(BOOKING_REPORT_FIELDS)
+    for row in _report_rows(bookings, totals):
+        yield writer.writerow(row)
+
+    # The totals follow the rows, separated by an empty line
+    yield writer.writerow([])
+    for name, value in totals.items():
+        yield writer.writerow([name, value])
+
+
+def stream_booking_report_ndjson(bookings):
+    totals = {'total_bookings': 0, 'total_sum': Decimal(0)}
+
+    for row in _report_rows(bookings, totals):
+        yield json.dumps(dict(zip(BOOKING_REPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n'
+
+    # The last line holds the totals
+    yield json.dumps(totals, cls=DjangoJSONEncoder) + '\n'
+
+
+def _nights():
+    return ExpressionWrapper(F('check_out_date') - F('check_in_date'), output_field=DurationField())
+
+
+REPORT_DIMENSIONS = {
+    'hotel': (F('room__hotel_id'), IntegerField()),
+    'room_type': (F('room__room_type_id'), IntegerField()),
+    'payment_method': (F('live_payment__payment_method'), CharField()),
+    'month': (TruncMonth('check_in_date'), DateField()),
+}
+
+REPORT_MEASURES = ('bookings', 'room_nights', 'revenue')
+
+
+def parse_group_by(value):
+    dimensions = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in dimensions if name not in REPORT_DIMENSIONS]
+    if unknown or not dimensions:
+        raise ValidationError(
+            f"Invalid 'group_by'. Use a comma separated list of: {', '.join(REPORT_DIMENSIONS)}."
+        )
+    return dimensions
+
+
+def _first_payment_row(by_method):
+    """
+    Whether the joined payment is the first live payment of the booking, or of the
+    booking and method when grouped by method. A booking without payments has one row.
+    """
+    earlier = Payment.objects.filter(
+        booking=OuterRef('pk'), is_deleted=False, pk__lt=OuterRef('live_payment__id')
+    )
+    if by_method:
+        earlier = earlier.filter(payment_method=OuterRef('live_payment__payment_method'))
+    return ~Exists(earlier)
+
+
+def grouped_booking_report(bookings, dimensions):
+    """
+    Totals of `bookings` for every prefix of `dimensions`, like GROUP BY ROLLUP.
+
+    Each grouping level is a grouped query where the rolled up dimensions are NULL, and
+    the levels are combined with UNION ALL so the database answers in one statement.
+    The result is columnar: `level` is the number of dimensions the row is grouped by,
+    so the detail rows come first and the grand total (level 0) last.
+
+    Grouping by payment_method joins the live payments, the revenue is then the amount
+    paid with each method. A booking then has one row per payment, its nights are only
+    counted on the first of its rows in the group (see _first_payment_row).
+    """
+    by_payment = 'payment_method' in dimensions
+    if by_payment:
+        bookings = bookings.annotate(
+            live_payment=FilteredRelation(
+                'payment_booking', condition=Q(payment_booking__is_deleted=False)
+            )
+        )
+        revenue = Sum('live_payment__amount')
+    else:
+        revenue = Sum('total_price')
+
+    levels = []
+    for level in range(len(dimensions), -1, -1):
+        grouped = dimensions[:level]
+        columns = {
+            name: expression if name in grouped else Value(None, output_field=output_field)
+            for name, (expression, output_field) in REPORT_DIMENSIONS.items()
+            if name in dimensions
+        }
+        if by_payment:
+            level_bookings = bookings.annotate(
+                first_row=_first_payment_row('payment_method' in grouped)
+            )
+            room_nights = Sum(_nights(), filter=Q(first_row=True))
+        else:
+            level_bookings = bookings
+            room_nights = Sum(_nights())
+
+        levels.append(
+            level_bookings.annotate(**columns)
+            .values(*dimensions)
+            .annotate(
+                level=Value(level),
+                bookings=Count('id', distinct=True),
+                room_nights=room_nights,
+                revenue=revenue,
+            )
+            .values_list(*dimensions, 'level', *REPORT_MEASURES)
+            .order_by()
+        )
+
+    rows = levels[0].union(*levels[1:], all=True).order_by('-level', *dimensions)
+    columns = [*dimensions, 'level', *REPORT_MEASURES]
+    nights_index = columns.index('room_nights')
+
+    return {
+        'columns': columns,
+        'rows': [
+            [
+                value.days if index == nights_index and value is not None else value
+                for index, value in enumerate(row)
+            ]
+            for row in rows
+        ],
+    }
@@ -0,0 +1,332 @@
+"""
+Incremental maintenance of the DailyRevenue and DailyPaymentTotal rollups.
+
+Every booking or payment write adds its contribution to the rollup row of its day and
+removes the contribution it had before the write, so the rollups stay in step with the
+raw rows without re-aggregating them. `rebuild_rollups` re-derives a date range from
+the raw rows and repairs any drift (bulk updates, raw SQL, lost writes).
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, QuerySet, Sum
+from .models import Booking, DailyPaymentTotal, DailyRevenue, Hotel, Payment, Room, RoomType
+
+
+BOOKING_FIELDS = ('is_deleted', 'room_id', 'check_in_date', 'check_out_date', 'total_price')
+PAYMENT_FIELDS = ('is_deleted', 'booking_id', 'payment_date', 'payment_method', 'amount')
+# Deleting these deletes their rollup rows as well (on_delete=CASCADE)
+ROLLUP_PARENTS = (Hotel, RoomType)
+
+
+def _add(model, key, deltas):
+    """
+    Add `deltas` to the rollup row identified by `key`, creating the row if needed.
+    """
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**increments):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created concurrently since the UPDATE
+        model.objects.filter(**key).update(**increments)
+
+
+def _room_dimensions(room_id, room=None):
+    if room is not None and room.pk == room_id:
+        return room.hotel_id, room.room_type_id
+    return Room.all_objects.filter(pk=room_id).values_list('hotel_id', 'room_type_id').get()
+
+
+def _booking_dimensions(booking_id, booking=None):
+    if booking is not None and booking.pk == booking_id:
+        room = booking.room if Booking.room.is_cached(booking) else None
+        return _room_dimensions(booking.room_id, room)
+    return (
+        Booking.all_objects.filter(pk=booking_id)
+        .values_list('room__hotel_id', 'room__room_type_id')
+        .get()
+    )
+
+
+def _previous_values(instance, fields):
+    """
+    The values the row had before the write, None if unknown or there was no row.
+    """
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None or not all(field in loaded for field in fields):
+        return None
+    return loaded
+
+
+def _current_values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def _booking_contribution(values, booking):
+    if values is None or values['is_deleted']:
+        return None
+
+    hotel_id, room_type_id = _room_dimensions(
+        values['room_id'], booking.room if Booking.room.is_cached(booking) else None
+    )
+    key = {'date': values['check_in_date'], 'hotel_id': hotel_id, 'room_type_id': room_type_id}
+    deltas = {
+        'bookings': 1,
+        'room_nights': (values['check_out_date'] - values['check_in_date']).days,
+        'revenue': values['total_price'],
+    }
+    return key, deltas
+
+
+def _payment_contribution(values, payment):
+    if values is None or values['is_deleted']:
+        return None
+
+    booking = payment.booking if Payment.booking.is_cached(payment) else None
+    hotel_id, room_type_id = _booking_dimensions(values['booking_id'], booking)
+    key = {
+        'date': values['payment_date'],
+        'hotel_id': hotel_id,
+        'room_type_id': room_type_id,
+        'payment_method': values['payment_method'],
+    }
+    deltas = {'payments': 1, 'amount': values['amount']}
+    return key, deltas
+
+
+def _apply(model, previous, current):
+    if previous == current:
+        return
+    if previous is not None:
+        key, deltas = previous
+        _add(model, key, {field: -value for field, value in deltas.items()})
+    if current is not None:
+        _add(model, *current)
+
+
+def _move_payments(booking, previous_room_id):
+    """
+    Move the payments of a booking moved to a room of another hotel or room type.
+    """
+    room = booking.room if Booking.room.is_cached(booking) else None
+    previous = _room_dimensions(previous_room_id)
+    current = _room_dimensions(booking.room_id, room)
+    if previous == current:
+        return
+
+    grouped = (
+        Payment.objects.filter(booking=booking)
+        .values('payment_date', 'payment_method')
+        .annotate(payments=Count('id'), amount=Sum('amount'))
+        .order_by()
+    )
+    for row in grouped:
+        for (hotel_id, room_type_id), sign in ((previous, -1), (current, 1)):
+            key = {
+                'date': row['payment_date'],
+                'hotel_id': hotel_id,
+                'room_type_id': room_type_id,
+                'payment_method': row['payment_method'],
+            }
+            deltas = {'payments': sign * row['payments'], 'amount': sign * row['amount']}
+            _add(DailyPaymentTotal, key, deltas)
+
+
+def booking_saved(booking, created):
+    previous = None if created else _previous_values(booking, BOOKING_FIELDS)
+    _apply(
+        DailyRevenue,
+        _booking_contribution(previous, booking),
+        _booking_contribution(_current_values(booking, BOOKING_FIELDS), booking),
+    )
+    # The payments are rolled up by the room of their booking
+    if previous is not None and previous['room_id'] != booking.room_id:
+        _move_payments(booking, previous['room_id'])
+
+
+def _deletes_rollups(origin):
+    """
+    Whether the hard delete of `origin` cascades to the rollup rows.
+
+    The cascade deletes the rollup rows before it sends the post_delete signals of the
+    bookings and payments, there is then nothing left to remove them from.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, ROLLUP_PARENTS)
+
+
+def booking_deleted(booking, origin=None):
+    if _deletes_rollups(origin):
+        return
+    _apply(
+        DailyRevenue,
+        _booking_contribution(_current_values(booking, BOOKING_FIELDS), booking),
+        None,
+    )
+
+
+def payment_saved(payment, created):
+    previous = None if created else _previous_values(payment, PAYMENT_FIELDS)
+    _apply(
+        DailyPaymentTotal,
+        _payment_contribution(previous, payment),
+        _payment_contribution(_current_values(payment, PAYMENT_FIELDS), payment),
+    )
+
+
+def payment_deleted(payment, origin=None):
+    if _deletes_rollups(origin):
+        return
+    _apply(
+        DailyPaymentTotal,
+        _payment_contribution(_current_values(payment, PAYMENT_FIELDS), payment),
+        None,
+    )
+
+
+def bookings_created(bookings, payments):
+    """
+    Add rows written with bulk_create, which sends no signals, one UPDATE per rollup row.
+    """
+    revenue = defaultdict(lambda: {'bookings': 0, 'room_nights': 0, 'revenue': Decimal(0)})
+    for booking in bookings:
+        key, deltas = _booking_contribution(_current_values(booking, BOOKING_FIELDS), booking)
+        for field, value in deltas.items():
+            revenue[tuple(key.items())][field] += value
+
+    payment_totals = defaultdict(lambda: {'payments': 0, 'amount': Decimal(0)})
+    for payment in payments:
+        key, deltas = _payment_contribution(_current_values(payment, PAYMENT_FIELDS), payment)
+        for field, value in deltas.items():
+            payment_totals[tuple(key.items())][field] += value
+
+    for key, deltas in revenue.items():
+        _add(DailyRevenue, dict(key), deltas)
+    for key, deltas in payment_totals.items():
+        _add(DailyPaymentTotal, dict(key), deltas)
+
+
+def _add_grouped(model, rows, sign):
+    """
+    Add (sign=1) or remove (sign=-1) the contribution of a queryset of rows updated in
+    bulk, one grouped query and one UPDATE per rollup row.
+    """
+    if model is Booking:
+        grouped = (
+            rows.values('check_in_date', 'room__hotel_id', 'room__room_type_id')
+            .annotate(
+                bookings=Count('id'),
+                room_nights=Sum(F('check_out_date') - F('check_in_date')),
+                revenue=Sum('total_price'),
+            )
+            .order_by()
+        )
+        for row in grouped:
+            key = {
+                'date': row['check_in_date'],
+                'hotel_id': row['room__hotel_id'],
+                'room_type_id': row['room__room_type_id'],
+            }
+            deltas = {
+                'bookings': sign * row['bookings'],
+                'room_nights': sign * row['room_nights'].days,
+                'revenue': sign * row['revenue'],
+            }
+            _add(DailyRevenue, key, deltas)
+    elif model is Payment:
+        grouped = (
+            rows.values(
+                'payment_date',
+                'booking__room__hotel_id',
+                'booking__room__room_type_id',
+                'payment_method',
+            )
+            .annotate(payments=Count('id'), amount=Sum('amount'))
+            .order_by()
+        )
+        for row in grouped:
+            key = {
+                'date': row['payment_date'],
+                'hotel_id': row['booking__room__hotel_id'],
+                'room_type_id': row['booking__room__room_type_id'],
+                'payment_method': row['payment_method'],
+            }
+            deltas = {'payments': sign * row['payments'], 'amount': sign * row['amount']}
+            _add(DailyPaymentTotal, key, deltas)
+
+
+def rows_soft_deleted(model, deleted_at):
+    """
+    Remove the rows soft deleted in bulk at `deleted_at`.
+    """
+    _add_grouped(model, model.deleted_objects.filter(deleted_at=deleted_at), -1)
+
+
+def rows_restored(model, restored_at):
+    """
+    Add back the rows restored in bulk at `restored_at`.
+    """
+    _add_grouped(model, model.objects.filter(updated_at=restored_at), 1)
+
+
+@transaction.atomic
+def rebuild_rollups(start_date, end_date):
+    """
+    Re-derive the rollup rows of [start_date, end_date] from the bookings and payments.
+    """
+    revenue = (
+        Booking.objects.filter(check_in_date__range=(start_date, end_date))
+        .values('check_in_date', 'room__hotel_id', 'room__room_type_id')
+        .annotate(
+            bookings=Count('id'),
+            room_nights=Sum(F('check_out_date') - F('check_in_date')),
+            revenue=Sum('total_price'),
+        )
+        .order_by()
+    )
+    payment_totals = (
+        Payment.objects.filter(payment_date__range=(start_date, end_date))
+        .values(
+            'payment_date',
+            'booking__room__hotel_id',
+            'booking__room__room_type_id',
+            'payment_method',
+        )
+        .annotate(payments=Count('id'), amount=Sum('amount'))
+        .order_by()
+    )
+
+    DailyRevenue.objects.filter(date__range=(start_date, end_date)).delete()
+    DailyRevenue.objects.bulk_create(
+        [
+            DailyRevenue(
+                date=row['check_in_date'],
+                hotel_id=row['room__hotel_id'],
+                room_type_id=row['room__room_type_id'],
+                bookings=row['bookings'],
+                room_nights=row['room_nights'].days,
+                revenue=row['revenue'],
+            )
+            for row in revenue
+        ]
+    )
+
+    DailyPaymentTotal.objects.filter(date__range=(start_date, end_date)).delete()
+    DailyPaymentTotal.objects.bulk_create(
+        [
+            DailyPaymentTotal(
+                date=row['payment_date'],
+                hotel_id=row['booking__room__hotel_id'],
+                room_type_id=row['booking__room__room_type_id'],
+                payment_method=row['payment_method'],
+                payments=row['payments'],
+                amount=row['amount'],
+            )
+            for row in payment_totals
+        ]
+    )
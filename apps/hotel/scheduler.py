@@ -0,0 +1,129 @@
+"""
+Event-driven updates of the cached `Room.status` flag.
+
+A delayed `sync_room_status` job is queued for the moments a booking changes the state
+of its room: the start of the check-in date and the hotel's check-out time on the
+check-out date. The delayed jobs wait in the worker memory, where the Redis broker
+redelivers them after its visibility timeout (1 hour) and a restart loses their
+revokes, so only the moments within ROOM_STATUS_SYNC_HORIZON are queued. A booking
+queues the moments the `update_room_status` sweep already went past, the sweep queues
+the others as they come due (see queue_due_room_status_syncs).
+
+The ids of the queued jobs are kept in the cache so they can be revoked when the
+booking is changed or deleted. The jobs are idempotent (they recompute the status from
+the bookings), so a stale job is harmless and the sweep reconciles anything a lost job
+missed.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+from celery import current_app
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from .models import Booking
+from .tasks import sync_room_status
+
+
+logger = logging.getLogger(__name__)
+
+# Below the visibility timeout of the broker, and above the interval of the sweep
+ROOM_STATUS_SYNC_HORIZON = timedelta(minutes=45)
+# Time up to which the sweep queued the jobs of the bookings
+ROOM_STATUS_QUEUED_UNTIL_KEY = 'hotel:room_status_jobs:queued_until'
+
+
+def _cache_key(booking_id):
+    return f'hotel:room_status_jobs:{booking_id}'
+
+
+def _aware(date, at):
+    return timezone.make_aware(datetime.combine(date, at))
+
+
+def room_status_change_times(booking):
+    """
+    Moments at which the booking changes the status of its room.
+    """
+    return [
+        _aware(booking.check_in_date, time.min),
+        _aware(booking.check_out_date, booking.room.hotel.check_out_time),
+    ]
+
+
+def _queue_jobs(booking, room_ids, etas):
+    if not etas:
+        return
+
+    try:
+        task_ids = [sync_room_status.apply_async(args=room_ids, eta=eta).id for eta in etas]
+    except OperationalError:
+        # The broker is unreachable, the reconciliation sweep will catch up
+        logger.warning('Could not schedule the room status jobs of booking %s', booking.pk)
+        return
+
+    # Added to the jobs of the booking queued by the sweep, if any
+    key = _cache_key(booking.pk)
+    timeout = (max(etas) - timezone.now() + timedelta(days=1)).total_seconds()
+    cache.set(key, (cache.get(key) or []) + task_ids, timeout=timeout)
+
+
+def schedule_room_status_sync(booking, room_ids=None):
+    """
+    Queue the jobs of the booking, syncing `room_ids` (by default the booking's room).
+
+    A booking moved to another room passes the previous room as well, so a job of the
+    previous room that could not be revoked does not leave it out of date.
+    """
+    cancel_room_status_sync(booking.pk)
+    room_ids = room_ids or [booking.room_id]
+
+    now = timezone.now()
+    queued_until = cache.get(ROOM_STATUS_QUEUED_UNTIL_KEY)
+    if queued_until is None or queued_until <= now:
+        # The sweep is late or has not run yet
+        queued_until = now + ROOM_STATUS_SYNC_HORIZON
+
+    etas = [eta for eta in room_status_change_times(booking) if now < eta <= queued_until]
+    _queue_jobs(booking, room_ids, etas)
+
+
+def queue_due_room_status_syncs():
+    """
+    Queue the jobs of the bookings coming due since the last run, called by the sweep.
+
+    Returns the number of bookings with queued jobs.
+    """
+    now = timezone.now()
+    start = cache.get(ROOM_STATUS_QUEUED_UNTIL_KEY)
+    if start is None or start < now:
+        # The past moments are reconciled by the sweep
+        start = now
+    end = now + ROOM_STATUS_SYNC_HORIZON
+
+    dates = (timezone.localdate(start), timezone.localdate(end))
+    bookings = Booking.objects.filter(
+        Q(check_in_date__range=dates) | Q(check_out_date__range=dates)
+    ).select_related('room__hotel')
+
+    queued = 0
+    for booking in bookings:
+        etas = [eta for eta in room_status_change_times(booking) if start < eta <= end]
+        if etas:
+            _queue_jobs(booking, [booking.room_id], etas)
+            queued += 1
+    cache.set(ROOM_STATUS_QUEUED_UNTIL_KEY, end, timeout=None)
+    return queued
+
+
+def cancel_room_status_sync(booking_id):
+    task_ids = cache.get(_cache_key(booking_id))
+    if not task_ids:
+        return
+
+    try:
+        current_app.control.revoke(task_ids)
+    except OperationalError:
+        logger.warning('Could not revoke the room status jobs of booking %s', booking_id)
+    cache.delete(_cache_key(booking_id))
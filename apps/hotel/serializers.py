@@ -1,6 +1,8 @@
 from django.utils import timezone
 from rest_framework import serializers
-from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment
+from rest_framework.validators import UniqueTogetherValidator
+from .models import Hotel, Staff, Guest, RoomType, RoomRate, Room, Booking, Payment
+from .availability import is_room_available
 
 
 class HotelSerializer(serializers.ModelSerializer):
@@ -27,6 +29,16 @@ class RoomTypeSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RoomRateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RoomRate
+        fields = '__all__'
+        validators = [
+            # Only one live rate per room type and date (see RoomRate.Meta.constraints)
+            UniqueTogetherValidator(queryset=RoomRate.objects.all(), fields=['room_type', 'date'])
+        ]
+
+
 class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
@@ -34,21 +46,25 @@ class RoomSerializer(serializers.ModelSerializer):
 
 
 class BookingSerializer(serializers.ModelSerializer):
+    # Method of the payment recorded with a new booking (see apps.hotel.services)
+    payment_method = serializers.ChoiceField(
+        choices=Payment.PAYMENT_METHOD_CHOICES,
+        default=Payment.PAYMENT_METHOD_CASH,
+        write_only=True,
+    )
+
     class Meta:
         model = Booking
         fields = '__all__'
 
     def validate(self, data):
-        check_in_date = data.get('check_in_date')
-        check_out_date = data.get('check_out_date')
-        room = data.get('room')
+        # Fall back to the stored values on partial updates
+        instance = self.instance
+        check_in_date = data.get('check_in_date', getattr(instance, 'check_in_date', None))
+        check_out_date = data.get('check_out_date', getattr(instance, 'check_out_date', None))
+        room = data.get('room', getattr(instance, 'room', None))
 
-        if room.status == Room.OCCUPIED:
-            raise serializers.ValidationError(
-                {'room': "The room is currently occupied and cannot be booked."}
-            )
-
-        if check_in_date and check_in_date < timezone.now().date():
+        if 'check_in_date' in data and check_in_date < timezone.now().date():
             raise serializers.ValidationError(
                 {'check_in_date': 'Check-in date cannot be in the past.'}
             )
@@ -58,8 +74,42 @@ class BookingSerializer(serializers.ModelSerializer):
                 {'check_out_date': 'Check-out date must be after check-in date.'}
             )
 
+        if room and check_in_date and check_out_date:
+            if not is_room_available(room, check_in_date, check_out_date, exclude=instance):
+                raise serializers.ValidationError(
+                    {'room': 'The room is already booked for the selected dates.'}
+                )
+
         return data
 
+    def update(self, instance, validated_data):
+        # Only new bookings record a payment
+        validated_data.pop('payment_method', None)
+        return super().update(instance, validated_data)
+
+
+class BulkBookingRowSerializer(serializers.Serializer):
+    guest = serializers.IntegerField()
+    room = serializers.IntegerField()
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+    payment_method = serializers.ChoiceField(
+        choices=Payment.PAYMENT_METHOD_CHOICES, default=Payment.PAYMENT_METHOD_CASH
+    )
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    MAX_ROWS = 500
+
+    bookings = BulkBookingRowSerializer(many=True, allow_empty=False)
+
+    def validate_bookings(self, value):
+        if len(value) > self.MAX_ROWS:
+            raise serializers.ValidationError(
+                f'A group booking cannot contain more than {self.MAX_ROWS} rooms.'
+            )
+        return value
+
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
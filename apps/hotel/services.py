@@ -0,0 +1,155 @@
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Guest, Room, Booking, Payment
+from .availability import is_room_available, refresh_room_status
+from .scheduler import schedule_room_status_sync
+from .rates import stay_price
+from . import rollups
+
+
+@transaction.atomic
+def create_booking(
+    guest, room, check_in_date, check_out_date, payment_method=Payment.PAYMENT_METHOD_CASH
+):
+    """
+    Book `room` for `guest` and record the payment for the stay.
+
+    The room row is locked for the rest of the transaction so concurrent bookings of
+    the same room are serialized and cannot both pass the availability check. The
+    data is expected to be validated already (see BookingSerializer), so the booking
+    and the payment are each written with a single INSERT.
+    """
+    room = (
+        Room.objects.select_for_update(of=('self',))
+        .select_related('room_type', 'hotel')
+        .get(pk=room.pk)
+    )
+
+    if not is_room_available(room, check_in_date, check_out_date):
+        raise ValidationError({'room': 'The room is already booked for the selected dates.'})
+
+    booking = Booking(
+        guest=guest,
+        room=room,
+        check_in_date=check_in_date,
+        check_out_date=check_out_date,
+        total_price=stay_price(room.room_type, check_in_date, check_out_date),
+    )
+    booking.save(validate=False)
+
+    Payment.objects.create(
+        booking=booking,
+        amount=booking.total_price,
+        payment_date=timezone.localdate(),
+        payment_method=payment_method,
+    )
+
+    return booking
+
+
+def _overlaps(intervals, check_in_date, check_out_date):
+    return any(start < check_out_date and end > check_in_date for start, end in intervals)
+
+
+@transaction.atomic
+def create_bookings_bulk(rows):
+    """
+    Book a group of rooms at once and return one result per row.
+
+    `rows` are dicts with guest, room, check_in_date, check_out_date and
+    payment_method (see BulkBookingRowSerializer). The rooms are locked and their
+    current bookings are loaded once; every row is checked against that snapshot and
+    against the rows accepted before it. Valid rows are then written with one
+    bulk INSERT for the bookings and one for the payments, and the statuses of the
+    booked rooms are refreshed with a single UPDATE. The revenue rollups get one
+    UPDATE per affected day.
+    """
+    room_ids = {row['room'] for row in rows}
+    guest_ids = {row['guest'] for row in rows}
+
+    rooms = (
+        Room.objects.select_for_update(of=('self',))
+        .select_related('room_type', 'hotel')
+        .in_bulk(room_ids)
+    )
+    guests = set(Guest.objects.filter(pk__in=guest_ids).values_list('pk', flat=True))
+
+    # Snapshot of the bookings that may overlap any of the requested stays
+    booked = defaultdict(list)
+    if rows:
+        window = Booking.objects.filter(
+            room_id__in=room_ids,
+            check_in_date__lt=max(row['check_out_date'] for row in rows),
+            check_out_date__gt=min(row['check_in_date'] for row in rows),
+        )
+        for room_id, start, end in window.values_list(
+            'room_id', 'check_in_date', 'check_out_date'
+        ):
+            booked[room_id].append((start, end))
+
+    today = timezone.localdate()
+    results = []
+    bookings = []
+    payment_methods = []
+
+    for index, row in enumerate(rows):
+        check_in_date = row['check_in_date']
+        check_out_date = row['check_out_date']
+        room = rooms.get(row['room'])
+        errors = {}
+
+        if row['guest'] not in guests:
+            errors['guest'] = 'Guest does not exist.'
+        if room is None:
+            errors['room'] = 'Room does not exist.'
+        if check_in_date < today:
+            errors['check_in_date'] = 'Check-in date cannot be in the past.'
+        if check_out_date <= check_in_date:
+            errors['check_out_date'] = 'Check-out date must be after check-in date.'
+        if not errors and _overlaps(booked[room.pk], check_in_date, check_out_date):
+            errors['room'] = 'The room is already booked for the selected dates.'
+
+        if errors:
+            results.append({'index': index, 'status': 'rejected', 'errors': errors})
+            continue
+
+        booked[room.pk].append((check_in_date, check_out_date))
+        bookings.append(
+            Booking(
+                guest_id=row['guest'],
+                room=room,
+                check_in_date=check_in_date,
+                check_out_date=check_out_date,
+                total_price=stay_price(room.room_type, check_in_date, check_out_date),
+            )
+        )
+        payment_methods.append(row['payment_method'])
+        results.append({'index': index, 'status': 'created', 'booking': bookings[-1]})
+
+    # NOTE: bulk_create does not send signals, the side effects of the
+    # Booking and Payment signal handlers are applied in bulk below.
+    Booking.objects.bulk_create(bookings)
+    payments = Payment.objects.bulk_create(
+        [
+            Payment(
+                booking=booking,
+                amount=booking.total_price,
+                payment_date=today,
+                payment_method=payment_method,
+            )
+            for booking, payment_method in zip(bookings, payment_methods)
+        ]
+    )
+    if bookings:
+        rollups.bookings_created(bookings, payments)
+        refresh_room_status({booking.room_id for booking in bookings})
+
+        def schedule_room_status_jobs():
+            for booking in bookings:
+                schedule_room_status_sync(booking)
+
+        transaction.on_commit(schedule_room_status_jobs)
+
+    return results
@@ -1,25 +1,126 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Booking, Room
+from common.models.soft_delete_models import post_soft_delete, post_soft_restore
+from .models import Booking, Payment, RoomRate
+from .availability import refresh_room_status
+from .scheduler import schedule_room_status_sync, cancel_room_status_sync
+from .rates import stay_price, invalidate_room_rates
+from . import rollups
+
+
+@receiver(pre_save, sender=Booking)
+def price_booking(sender, instance, **kwargs):
+    # Price new bookings that were not priced by the caller (see apps.hotel.services)
+    if instance._state.adding and not instance.total_price:
+        instance.total_price = stay_price(
+            instance.room.room_type, instance.check_in_date, instance.check_out_date
+        )
+
+
+def booking_room_ids(booking):
+    """
+    The room of the booking, and the room it was moved from by this save if any.
+
+    The reconciliation sweep only looks at the rooms of the bookings starting or ending
+    (see apps.hotel.tasks.update_room_status), it would never free the previous room.
+    """
+    room_ids = [booking.room_id]
+    # The values the row had before this save (see BaseModel.from_db)
+    loaded = getattr(booking, '_loaded_values', None)
+    if loaded is not None and loaded.get('room_id') not in (None, booking.room_id):
+        room_ids.append(loaded['room_id'])
+    return room_ids
 
 
 @receiver(post_save, sender=Booking)
 def update_room_status_on_booking(sender, instance, created, **kwargs):
-    if created:
-        # Calculate the total price
-        nights = (instance.check_out_date - instance.check_in_date).days
-        room_type = instance.room.room_type
-        instance.total_price = nights * room_type.price_per_night
-        instance.save()
+    # The total price is set before the INSERT (see price_booking), so only the room
+    # status is left to update. It is only marked as occupied when the booking covers today
+    room_ids = booking_room_ids(instance)
+    refresh_room_status(room_ids)
 
-        # Set the room status to 'occupied'
-        room = instance.room
-        room.status = Room.OCCUPIED
-        room.save()
+    # Soft deletes and restores are saves as well
+    if instance.is_deleted:
+        cancel_room_status_sync(instance.pk)
+    else:
+        # Queue the status changes at check-in and check-out once the booking is committed
+        transaction.on_commit(lambda: schedule_room_status_sync(instance, room_ids))
 
 
 @receiver(post_delete, sender=Booking)
 def update_room_status_on_checkout(sender, instance, **kwargs):
-    room = instance.room
-    room.status = Room.AVAILABLE
-    room.save()
+    refresh_room_status([instance.room_id])
+    cancel_room_status_sync(instance.pk)
+
+
+@receiver(post_soft_delete, sender=Booking)
+def update_room_status_on_bulk_delete(sender, deleted_at, **kwargs):
+    bookings = Booking.deleted_objects.filter(deleted_at=deleted_at)
+    refresh_room_status(bookings.values('room_id'))
+    for booking_id in bookings.values_list('pk', flat=True):
+        cancel_room_status_sync(booking_id)
+
+
+@receiver(post_soft_restore, sender=Booking)
+def update_room_status_on_bulk_restore(sender, restored_at, **kwargs):
+    bookings = Booking.objects.filter(updated_at=restored_at)
+    refresh_room_status(bookings.values('room_id'))
+
+    def schedule():
+        for booking in bookings.select_related('room__hotel'):
+            schedule_room_status_sync(booking)
+
+    transaction.on_commit(schedule)
+
+
+@receiver(post_save, sender=Booking)
+def update_revenue_rollup_on_booking(sender, instance, created, **kwargs):
+    rollups.booking_saved(instance, created)
+
+
+@receiver(post_delete, sender=Booking)
+def update_revenue_rollup_on_booking_delete(sender, instance, origin=None, **kwargs):
+    rollups.booking_deleted(instance, origin)
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollup_on_payment(sender, instance, created, **kwargs):
+    rollups.payment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Payment)
+def update_payment_rollup_on_payment_delete(sender, instance, origin=None, **kwargs):
+    rollups.payment_deleted(instance, origin)
+
+
+@receiver(post_soft_delete, sender=Booking)
+@receiver(post_soft_delete, sender=Payment)
+def update_rollups_on_bulk_delete(sender, deleted_at, **kwargs):
+    rollups.rows_soft_deleted(sender, deleted_at)
+
+
+@receiver(post_soft_restore, sender=Booking)
+@receiver(post_soft_restore, sender=Payment)
+def update_rollups_on_bulk_restore(sender, restored_at, **kwargs):
+    rollups.rows_restored(sender, restored_at)
+
+
+@receiver(post_save, sender=RoomRate)
+@receiver(post_delete, sender=RoomRate)
+def invalidate_room_rates_on_change(sender, instance, **kwargs):
+    invalidate_room_rates(instance.room_type_id)
+
+
+@receiver(post_soft_delete, sender=RoomRate)
+def invalidate_room_rates_on_bulk_delete(sender, deleted_at, **kwargs):
+    room_rates = RoomRate.deleted_objects.filter(deleted_at=deleted_at)
+    for room_type_id in room_rates.values_list('room_type_id', flat=True).distinct():
+        invalidate_room_rates(room_type_id)
+
+
+@receiver(post_soft_restore, sender=RoomRate)
+def invalidate_room_rates_on_bulk_restore(sender, restored_at, **kwargs):
+    room_rates = RoomRate.objects.filter(updated_at=restored_at)
+    for room_type_id in room_rates.values_list('room_type_id', flat=True).distinct():
+        invalidate_room_rates(room_type_id)
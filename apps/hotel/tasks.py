@@ -1,14 +1,78 @@
+import logging
+import time
+from datetime import timedelta
 from celery import shared_task
+from django.core.cache import cache
+from django.db.models import Q
 from django.utils import timezone
-from apps.hotel.models import Room, Booking
+from apps.hotel.models import Booking
+from apps.hotel.availability import refresh_room_status
+from apps.hotel.rollups import rebuild_rollups
+
+
+logger = logging.getLogger(__name__)
+
+# Date up to which the room statuses have already been reconciled
+ROOM_STATUS_HIGH_WATER_MARK_KEY = 'hotel:update_room_status:high_water_mark'
+
+
+@shared_task
+def sync_room_status(room_id, *other_room_ids):
+    """
+    Scheduled by apps.hotel.scheduler when a booking starts or ends.
+    """
+    return refresh_room_status([room_id, *other_room_ids])
 
 
 @shared_task
 def update_room_status():
-    today = timezone.now().date()
-    expired_bookings = Booking.objects.filter(check_out_date__lt=today, room__status=Room.OCCUPIED)
+    """
+    Reconciliation sweep for the statuses the scheduled jobs may have missed, which
+    also queues the jobs coming due (see apps.hotel.scheduler).
+    """
+    from apps.hotel.scheduler import queue_due_room_status_syncs
+
+    started = time.monotonic()
+    today = timezone.localdate()
+    high_water_mark = cache.get(ROOM_STATUS_HIGH_WATER_MARK_KEY)
+
+    # Only the rooms of the bookings starting or ending since the last run can have
+    # changed. Without a high-water mark (first run, cache flushed) every room is refreshed.
+    if high_water_mark is None:
+        rooms_refreshed = refresh_room_status()
+    else:
+        changed = Booking.objects.filter(
+            Q(check_in_date__range=(high_water_mark, today))
+            | Q(check_out_date__range=(high_water_mark, today))
+        )
+        # UPDATE ... WHERE id IN (subquery)
+        rooms_refreshed = refresh_room_status(changed.values('room_id'))
+    cache.set(ROOM_STATUS_HIGH_WATER_MARK_KEY, today, timeout=None)
+    bookings_queued = queue_due_room_status_syncs()
+
+    duration_ms = round((time.monotonic() - started) * 1000, 2)
+    logger.info(
+        'Refreshed the status of %s rooms and queued the jobs of %s bookings in %sms',
+        rooms_refreshed,
+        bookings_queued,
+        duration_ms,
+    )
+    return {
+        'rooms_refreshed': rooms_refreshed,
+        'bookings_queued': bookings_queued,
+        'duration_ms': duration_ms,
+    }
+
+
+@shared_task
+def rebuild_revenue_rollups(days_back=90, days_ahead=365):
+    """
+    Nightly repair of the revenue rollups around today, see apps.hotel.rollups.
+    """
+    started = time.monotonic()
+    today = timezone.localdate()
+    rebuild_rollups(today - timedelta(days=days_back), today + timedelta(days=days_ahead))
 
-    for booking in expired_bookings:
-        room = booking.room
-        room.status = Room.AVAILABLE
-        room.save()
+    duration_ms = round((time.monotonic() - started) * 1000, 2)
+    logger.info('Rebuilt the revenue rollups in %sms', duration_ms)
+    return {'duration_ms': duration_ms}
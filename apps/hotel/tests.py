@@ -1,3 +1,885 @@
+import csv
+import io
+import json
+from datetime import time, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.accounts.models import User
+from common.archive import archive_soft_deleted
+from common.models import ArchivedRow
+from .availability import available_rooms, is_room_available
+from .rates import nightly_prices, stay_price
+from .reports import BOOKING_REPORT_FIELDS
+from .rollups import rebuild_rollups
+from .scheduler import queue_due_room_status_syncs, room_status_change_times
+from .services import create_booking, create_bookings_bulk
+from .models import (
+    Hotel,
+    Guest,
+    RoomType,
+    Room,
+    Booking,
+    Payment,
+    RoomRate,
+    DailyRevenue,
+    DailyPaymentTotal,
+)
+
+
+class HotelTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.hotel = Hotel.objects.create(
+            name='Hotel',
+            address='Address',
+            village='Village',
+            district='District',
+            province='Province',
+            phone='020 1234 5678',
+            email='hotel@example.com',
+            stars=3,
+            check_in_time=time(14),
+            check_out_time=time(12),
+        )
+        cls.room_type = RoomType.objects.create(name='Double', price_per_night=100, capacity=2)
+        cls.rooms = [
+            Room.objects.create(hotel=cls.hotel, room_type=cls.room_type, room_number=f'R{i}')
+            for i in range(3)
+        ]
+        cls.guest = Guest.objects.create(
+            first_name='Guest',
+            last_name='One',
+            date_of_birth=cls.today.replace(year=1990),
+            address='Address',
+            phone='020 8765 4321',
+            email='guest@example.com',
+        )
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', 'pw')
+
+    def setUp(self):
+        # The cache outlives the transaction of each test
+        cache.clear()
+
+    def days(self, count):
+        return self.today + timedelta(days=count)
+
+    def book(self, room, check_in, check_out, **kwargs):
+        return Booking.objects.create(
+            guest=self.guest,
+            room=room,
+            check_in_date=self.days(check_in),
+            check_out_date=self.days(check_out),
+            **kwargs,
+        )
+
+
+class AvailabilityTests(HotelTestCase):
+    def test_stays_are_half_open(self):
+        room = self.rooms[0]
+        self.book(room, 2, 5)
+
+        self.assertFalse(is_room_available(room, self.days(4), self.days(6)))
+        self.assertFalse(is_room_available(room, self.days(1), self.days(3)))
+        self.assertFalse(is_room_available(room, self.days(3), self.days(4)))
+        # Checking in on the day the other guest checks out
+        self.assertTrue(is_room_available(room, self.days(5), self.days(7)))
+        self.assertTrue(is_room_available(room, self.days(0), self.days(2)))
+
+    def test_available_rooms_excludes_overlapping_bookings(self):
+        self.book(self.rooms[0], 2, 5)
+
+        rooms = available_rooms(self.days(3), self.days(4), hotel=self.hotel.pk)
+        self.assertEqual([room.pk for room in rooms], [self.rooms[1].pk, self.rooms[2].pk])
+
+    def test_soft_deleted_bookings_free_the_room(self):
+        booking = self.book(self.rooms[0], 2, 5)
+        booking.delete()
+
+        self.assertTrue(is_room_available(self.rooms[0], self.days(3), self.days(4)))
+
+
+class RoomStatusTests(HotelTestCase):
+    def status(self, room):
+        return Room.objects.values_list('status', flat=True).get(pk=room.pk)
+
+    def test_booking_covering_today_occupies_the_room(self):
+        self.book(self.rooms[0], 0, 2)
+        self.book(self.rooms[1], 1, 2)
+
+        self.assertEqual(self.status(self.rooms[0]), Room.OCCUPIED)
+        self.assertEqual(self.status(self.rooms[1]), Room.AVAILABLE)
+
+    def test_moving_a_booking_frees_the_previous_room(self):
+        booking = self.book(self.rooms[0], 0, 2)
+        booking = Booking.objects.get(pk=booking.pk)
+
+        booking.room = self.rooms[1]
+        booking.save()
+
+        self.assertEqual(self.status(self.rooms[0]), Room.AVAILABLE)
+        self.assertEqual(self.status(self.rooms[1]), Room.OCCUPIED)
+
+    def test_moved_booking_jobs_sync_both_rooms(self):
+        booking = Booking.objects.get(pk=self.book(self.rooms[0], 1, 3).pk)
+
+        horizon = mock.patch('apps.hotel.scheduler.ROOM_STATUS_SYNC_HORIZON', timedelta(days=5))
+        apply_async = mock.patch('apps.hotel.scheduler.sync_room_status.apply_async')
+        with horizon, apply_async as apply_async:
+            apply_async.return_value.id = 'job'
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.room = self.rooms[1]
+                booking.save()
+
+        self.assertEqual(apply_async.call_count, 2)
+        for call in apply_async.call_args_list:
+            self.assertEqual(call.kwargs['args'], [self.rooms[1].pk, self.rooms[0].pk])
+
+    def test_only_the_jobs_within_the_horizon_are_queued(self):
+        with mock.patch('apps.hotel.scheduler.sync_room_status.apply_async') as apply_async:
+            apply_async.return_value.id = 'job'
+            with self.captureOnCommitCallbacks(execute=True):
+                later = self.book(self.rooms[0], 30, 32)
+            apply_async.assert_not_called()
+
+            # The sweep queues them as they come due
+            check_in = room_status_change_times(later)[0]
+            now = check_in - timedelta(minutes=10)
+            with mock.patch('django.utils.timezone.now', return_value=now):
+                self.assertEqual(queue_due_room_status_syncs(), 1)
+                self.assertEqual(queue_due_room_status_syncs(), 0)
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], [self.rooms[0].pk])
+        self.assertEqual(apply_async.call_args.kwargs['eta'], check_in)
+
+
+class RateCalendarTests(HotelTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # A gap on day 12, the base price is 100
+        for day, price in ((10, 150), (11, 160), (13, 170)):
+            RoomRate.objects.create(
+                room_type=cls.room_type, date=cls.today + timedelta(days=day), price=price
+            )
+
+    def prices(self, check_in, check_out):
+        cents = nightly_prices(self.room_type, self.days(check_in), self.days(check_out))
+        return [price // 100 for price in cents.tolist()]
+
+    def test_nightly_prices(self):
+        cases = {
+            'before': ((1, 3), [100, 100]),
+            'up to the first rate': ((8, 11), [100, 100, 150]),
+            'inside with a gap': ((10, 14), [150, 160, 100, 170]),
+            'from the last rate': ((13, 16), [170, 100, 100]),
+            'after': ((20, 22), [100, 100]),
+            'across': ((9, 15), [100, 150, 160, 100, 170, 100]),
+        }
+        for name, ((check_in, check_out), expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.prices(check_in, check_out), expected)
+
+    def test_stay_price(self):
+        self.assertEqual(stay_price(self.room_type, self.days(9), self.days(12)), Decimal('410.00'))
+
+    def test_edit_reprices_once_committed(self):
+        self.assertEqual(self.prices(10, 12), [150, 160])
+        rate = RoomRate.objects.get(room_type=self.room_type, date=self.days(11))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            rate.price = 200
+            rate.save()
+            RoomRate.objects.create(room_type=self.room_type, date=self.days(14), price=90)
+            # Not committed yet, the other processes keep the current rates
+            self.assertEqual(self.prices(10, 12), [150, 160])
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.prices(10, 16), [150, 200, 100, 170, 90, 100])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rate.delete()
+        self.assertEqual(self.prices(10, 12), [150, 100])
+
+
+class HotelApiTestCase(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def booking_data(self, room, **data):
+        return {
+            'guest': self.guest.pk,
+            'room': room.pk,
+            'check_in_date': self.days(1),
+            'check_out_date': self.days(3),
+            **data,
+        }
+
+
+
+class BookingApiTests(HotelApiTestCase):
+    def test_create_records_the_payment(self):
+        response = self.client.post(
+            '/api/bookings/',
+            self.booking_data(self.rooms[0], payment_method=Payment.PAYMENT_METHOD_CREDIT_CARD),
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('payment_method', response.data)
+        payment = Payment.objects.get(booking=response.data['id'])
+        self.assertEqual(payment.payment_method, Payment.PAYMENT_METHOD_CREDIT_CARD)
+        self.assertEqual(payment.amount, 200)
+
+    def test_create_rejects_invalid_payment_methods(self):
+        for payment_method in ('cheque', ['cash'], {'method': 'cash'}):
+            with self.subTest(payment_method=payment_method):
+                response = self.client.post(
+                    '/api/bookings/',
+                    self.booking_data(self.rooms[0], payment_method=payment_method),
+                    format='json',
+                )
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('payment_method', response.data)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_create_rejects_overlapping_stays(self):
+        self.book(self.rooms[0], 2, 4)
+
+        response = self.client.post(
+            '/api/bookings/', self.booking_data(self.rooms[0]), format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('room', response.data)
+
+    def test_update_ignores_the_payment_method(self):
+        booking = self.book(self.rooms[0], 1, 3)
+
+        response = self.client.put(
+            f'/api/bookings/{booking.pk}/',
+            self.booking_data(self.rooms[1], payment_method=Payment.PAYMENT_METHOD_DEBIT_CARD),
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['room'], self.rooms[1].pk)
+        self.assertFalse(Payment.objects.exists())
+
+
+class BulkBookingTests(HotelApiTestCase):
+    def test_rows_are_checked_one_by_one(self):
+        self.book(self.rooms[2], 1, 5)
+        rows = [
+            self.booking_data(self.rooms[0]),
+            # Overlaps the row before it
+            self.booking_data(self.rooms[0], check_in_date=self.days(2)),
+            # Overlaps a stored booking
+            self.booking_data(self.rooms[2]),
+            self.booking_data(self.rooms[1], check_in_date=self.days(-1)),
+            self.booking_data(self.rooms[1], guest=0),
+            self.booking_data(self.rooms[1], payment_method=Payment.PAYMENT_METHOD_BANK_TRANSFER),
+        ]
+
+        response = self.client.post('/api/bookings/bulk/', {'bookings': rows}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['rejected']), (2, 4))
+        results = response.data['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'rejected', 'rejected', 'rejected', 'rejected', 'created'],
+        )
+        self.assertEqual(list(results[1]['errors']), ['room'])
+        self.assertEqual(list(results[2]['errors']), ['room'])
+        self.assertEqual(list(results[3]['errors']), ['check_in_date'])
+        self.assertEqual(list(results[4]['errors']), ['guest'])
+
+        self.assertEqual(Booking.objects.count(), 3)
+        self.assertEqual(
+            sorted(Payment.objects.values_list('payment_method', flat=True)),
+            [Payment.PAYMENT_METHOD_BANK_TRANSFER, Payment.PAYMENT_METHOD_CASH],
+        )
+
+    def test_nothing_created_is_a_bad_request(self):
+        self.book(self.rooms[0], 1, 5)
+
+        response = self.client.post(
+            '/api/bookings/bulk/', {'bookings': [self.booking_data(self.rooms[0])]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+
+    def test_invalid_rows_fail_the_whole_request(self):
+        rows = [
+            self.booking_data(self.rooms[0]),
+            self.booking_data(self.rooms[1], check_in_date='soon'),
+        ]
+
+        response = self.client.post('/api/bookings/bulk/', {'bookings': rows}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+
+
+REVENUE_MEASURES = ('bookings', 'room_nights', 'revenue')
+PAYMENT_MEASURES = ('payment_method', 'payments', 'amount')
+
+
+class RollupTests(HotelApiTestCase):
+    def rollups(self):
+        revenue = DailyRevenue.objects.exclude(bookings=0, room_nights=0, revenue=0)
+        payments = DailyPaymentTotal.objects.exclude(payments=0, amount=0)
+        return (
+            sorted(revenue.values_list('date', 'hotel', 'room_type', *REVENUE_MEASURES)),
+            sorted(payments.values_list('date', 'hotel', 'room_type', *PAYMENT_MEASURES)),
+        )
+
+    def assertRollupsRebuilt(self):
+        maintained = self.rollups()
+        rebuild_rollups(self.days(-30), self.days(30))
+        self.assertEqual(maintained, self.rollups())
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        other_type = RoomType.objects.create(name='Suite', price_per_night=250, capacity=4)
+        suite = Room.objects.create(hotel=self.hotel, room_type=other_type, room_number='S1')
+
+        moved = create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        create_booking(
+            self.guest, suite, self.days(1), self.days(2), Payment.PAYMENT_METHOD_CREDIT_CARD
+        )
+        deleted = create_booking(self.guest, self.rooms[1], self.days(4), self.days(6))
+        create_bookings_bulk(
+            [
+                {
+                    'guest': self.guest.pk,
+                    'room': room.pk,
+                    'check_in_date': self.days(7),
+                    'check_out_date': self.days(9),
+                    'payment_method': Payment.PAYMENT_METHOD_BANK_TRANSFER,
+                }
+                for room in self.rooms
+            ]
+        )
+        self.assertRollupsRebuilt()
+
+        # Moved to another room type and other dates
+        moved = Booking.objects.get(pk=moved.pk)
+        moved.room = suite
+        moved.check_in_date, moved.check_out_date = self.days(10), self.days(13)
+        moved.total_price = 750
+        moved.save()
+        self.assertRollupsRebuilt()
+
+        # Soft deleted with its payment, then restored
+        deleted = Booking.objects.get(pk=deleted.pk)
+        deleted.delete()
+        self.assertRollupsRebuilt()
+        Booking.deleted_objects.get(pk=deleted.pk).restore()
+        self.assertRollupsRebuilt()
+
+        # Deleted in bulk
+        Booking.objects.filter(check_in_date=self.days(7)).delete()
+        self.assertRollupsRebuilt()
+        Booking.deleted_objects.all().restore()
+        self.assertRollupsRebuilt()
+
+        payment = Payment.objects.filter(booking=moved).get()
+        payment.payment_method = Payment.PAYMENT_METHOD_DEBIT_CARD
+        payment.save()
+        payment.hard_delete()
+        self.assertRollupsRebuilt()
+
+    def test_hard_delete_with_bookings(self):
+        other_hotel = Hotel.objects.create(
+            name='Other', stars=4, check_in_time=time(14), check_out_time=time(11)
+        )
+        other_room = Room.objects.create(
+            hotel=other_hotel, room_type=self.room_type, room_number='O1'
+        )
+        create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        create_booking(self.guest, self.rooms[1], self.days(2), self.days(4))
+        create_booking(self.guest, other_room, self.days(1), self.days(2))
+
+        # The rooms of the hotel go with it, and so do its bookings, payments and rollups
+        response = self.client.delete(f'/api/hotels/{self.hotel.pk}/hard-delete/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(DailyRevenue.objects.filter(hotel=self.hotel.pk).exists())
+        self.assertRollupsRebuilt()
+
+        # A room is not a dimension of the rollups, they are updated
+        other_room.hard_delete()
+        self.assertFalse(DailyRevenue.objects.exclude(bookings=0).exists())
+        self.assertRollupsRebuilt()
+
+        RoomType.objects.get(pk=self.room_type.pk).hard_delete()
+        self.assertFalse(DailyRevenue.objects.exists())
+
+    def test_revenue_reads_the_rollups(self):
+        create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        create_booking(
+            self.guest,
+            self.rooms[1],
+            self.days(1),
+            self.days(2),
+            payment_method=Payment.PAYMENT_METHOD_CREDIT_CARD,
+        )
+
+        response = self.client.get(
+            '/api/bookings/revenue/',
+            {'start_date': self.days(0), 'end_date': self.days(5)},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_bookings'], 2)
+        self.assertEqual(response.data['total_room_nights'], 3)
+        self.assertEqual(response.data['total_revenue'], 300)
+        self.assertEqual(
+            [(row['payment_method'], row['amount']) for row in response.data['payments']],
+            [(Payment.PAYMENT_METHOD_CASH, 200), (Payment.PAYMENT_METHOD_CREDIT_CARD, 100)],
+        )
+
+
+class BookingReportStreamTests(HotelApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book(self.rooms[0], 1, 3, total_price=200)
+        self.book(self.rooms[1], 2, 5, total_price=300)
+        # Checks out after the end of the range
+        self.book(self.rooms[2], 8, 12, total_price=400)
+
+    def get(self, **params):
+        return self.client.get(
+            '/api/bookings/report/',
+            {'start_date': self.days(0), 'end_date': self.days(10), **params},
+        )
+
+    def stream(self, format):
+        response = self.get(format=format)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        filename = f'bookings-report-{self.days(0)}-{self.days(10)}.{format}'
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{filename}"')
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.stream('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], list(BOOKING_REPORT_FIELDS))
+        self.assertEqual(
+            sorted(rows[1:3]),
+            [
+                ['Guest', 'One', 'R0', str(self.days(1)), str(self.days(3)), '200.00'],
+                ['Guest', 'One', 'R1', str(self.days(2)), str(self.days(5)), '300.00'],
+            ],
+        )
+        # The totals follow an empty line
+        self.assertEqual(rows[3:], [[], ['total_bookings', '2'], ['total_sum', '500.00']])
+
+    def test_ndjson(self):
+        response, content = self.stream('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            sorted((line['room__room_number'], line['total_price']) for line in lines[:-1]),
+            [('R0', '200.00'), ('R1', '300.00')],
+        )
+        self.assertEqual(lines[-1], {'total_bookings': 2, 'total_sum': '500.00'})
+
+    def test_empty_range(self):
+        response = self.client.get(
+            '/api/bookings/report/',
+            {'start_date': self.days(20), 'end_date': self.days(30), 'format': 'ndjson'},
+        )
+        content = b''.join(response.streaming_content).decode()
+        # Only the totals line
+        self.assertEqual(json.loads(content), {'total_bookings': 0, 'total_sum': '0'})
+
+    def test_csv_error(self):
+        response = self.client.get(
+            '/api/bookings/report/', {'start_date': self.days(0), 'format': 'csv'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+        rows = list(csv.reader(io.StringIO(response.content.decode())))
+        self.assertEqual(rows, [['detail'], ["Both 'start_date' and 'end_date' are required."]])
+
+
+class GroupedReportTests(HotelApiTestCase):
+    def report(self, group_by):
+        response = self.client.get(
+            '/api/bookings/report/',
+            {'start_date': self.days(0), 'end_date': self.days(10), 'group_by': group_by},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [dict(zip(response.data['columns'], row)) for row in response.data['rows']]
+
+    def test_totals_with_several_payments_per_booking(self):
+        # 2 nights paid 200 + 50 in cash and 70 by card
+        split = create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        for amount, payment_method in ((50, 'cash'), (70, 'credit_card')):
+            Payment.objects.create(
+                booking=split,
+                amount=amount,
+                payment_date=self.today,
+                payment_method=payment_method,
+            )
+        # 3 nights paid 300 by card
+        create_booking(
+            self.guest,
+            self.rooms[1],
+            self.days(2),
+            self.days(5),
+            payment_method=Payment.PAYMENT_METHOD_CREDIT_CARD,
+        )
+        # 1 night not paid
+        self.book(self.rooms[2], 1, 2)
+
+        rows = {
+            (row['level'], row['payment_method']): (
+                row['bookings'],
+                row['room_nights'],
+                row['revenue'],
+            )
+            for row in self.report('hotel,payment_method')
+        }
+
+        self.assertEqual(
+            rows,
+            {
+                (2, None): (1, 1, None),
+                (2, 'cash'): (1, 2, 250),
+                (2, 'credit_card'): (2, 5, 370),
+                (1, None): (3, 6, 620),
+                (0, None): (3, 6, 620),
+            },
+        )
+
+    def test_totals_without_payments(self):
+        create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        self.book(self.rooms[1], 2, 5, total_price=150)
+
+        rows = self.report('room_type')
+
+        self.assertEqual(
+            [(row['level'], row['bookings'], row['room_nights'], row['revenue']) for row in rows],
+            [(1, 2, 5, 350), (0, 2, 5, 350)],
+        )
+
+
+class SoftDeleteTests(HotelApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booking = create_booking(self.guest, self.rooms[0], self.days(1), self.days(3))
+        self.payment = Payment.objects.get(booking=self.booking)
+
+    def deleted_at(self, *instances):
+        return {
+            type(instance).__name__: type(instance).all_objects.get(pk=instance.pk).deleted_at
+            for instance in instances
+        }
+
+    def test_delete_cascades_in_one_batch(self):
+        Hotel.objects.get(pk=self.hotel.pk).delete()
+
+        deleted_at = self.deleted_at(self.hotel, self.rooms[0], self.booking, self.payment)
+        self.assertIsNotNone(deleted_at['Hotel'])
+        self.assertEqual(set(deleted_at.values()), {deleted_at['Hotel']})
+        self.assertFalse(Room.objects.filter(hotel=self.hotel).exists())
+        self.assertFalse(Payment.objects.exists())
+        # Not owned by the hotel
+        self.assertTrue(Guest.objects.filter(pk=self.guest.pk).exists())
+        self.assertTrue(RoomType.objects.filter(pk=self.room_type.pk).exists())
+
+    def test_queryset_delete_cascades(self):
+        count = Room.objects.filter(pk__in=[self.rooms[0].pk, self.rooms[1].pk]).delete()
+
+        self.assertEqual(count, 2)
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+
+    def test_restore_only_restores_the_same_batch(self):
+        # Deleted on its own before the hotel
+        Booking.objects.get(pk=self.booking.pk).delete()
+        Hotel.objects.get(pk=self.hotel.pk).delete()
+
+        Hotel.deleted_objects.get(pk=self.hotel.pk).restore()
+
+        self.assertEqual(Room.objects.filter(hotel=self.hotel).count(), 3)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+
+        Booking.deleted_objects.all().restore()
+        self.assertEqual(Payment.objects.get().pk, self.payment.pk)
+
+    def test_queryset_restore_per_batch(self):
+        Room.objects.filter(pk=self.rooms[0].pk).delete()
+        Room.objects.filter(pk=self.rooms[1].pk).delete()
+
+        count = Room.deleted_objects.all().restore()
+
+        self.assertEqual(count, 2)
+        self.assertEqual(Room.objects.count(), 3)
+        self.assertEqual(Booking.objects.get().pk, self.booking.pk)
+        self.assertEqual(Payment.objects.get().pk, self.payment.pk)
+
+    def test_archived_rows_are_restored_with_their_batch(self):
+        Hotel.objects.get(pk=self.hotel.pk).delete()
+        long_ago = timezone.now() - timedelta(days=200)
+        for model in (Hotel, Room, Booking, Payment):
+            model.all_objects.filter(is_deleted=True).update(deleted_at=long_ago)
+
+        archived = archive_soft_deleted(days=90, pause=0)
+
+        self.assertEqual(
+            archived,
+            {'hotel.Payment': 1, 'hotel.Booking': 1, 'hotel.Room': 3, 'hotel.Hotel': 1},
+        )
+        self.assertFalse(Room.all_objects.exists())
+        self.assertEqual(
+            ArchivedRow.objects.filter(content_type=ContentType.objects.get_for_model(Room))
+            .count(),
+            3,
+        )
+
+        response = self.client.post(f'/api/hotels/{self.hotel.pk}/restore/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ArchivedRow.objects.exists())
+        self.assertEqual(Room.objects.filter(hotel=self.hotel).count(), 3)
+        payment = Payment.objects.get()
+        self.assertEqual((payment.pk, payment.amount), (self.payment.pk, self.payment.amount))
+
+    def test_recent_deletions_are_not_archived(self):
+        Booking.objects.get(pk=self.booking.pk).delete()
+
+        self.assertEqual(archive_soft_deleted(days=90, pause=0), {})
+        self.assertTrue(Booking.deleted_objects.filter(pk=self.booking.pk).exists())
+
+
+class KeysetPaginationTests(HotelApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            Guest.objects.create(
+                first_name=f'Guest {i}',
+                last_name='Other',
+                date_of_birth=self.today.replace(year=1990),
+                address='Address',
+                phone='020 0000 0000',
+                email=f'guest{i}@example.com',
+            )
+        # Ties on updated_at are ordered by id
+        Guest.objects.filter(first_name__in=['Guest 1', 'Guest 2', 'Guest 3']).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        guests = Guest.objects.order_by('-updated_at', 'id')
+        self.expected = list(guests.values_list('pk', flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([guest['id'] for guest in response.data['results']])
+            url = response.data[link]
+        return pages, response.data
+
+    def test_next_and_previous_links_walk_every_row_once(self):
+        pages, last = self.walk('/api/guests/?page_size=3', 'next')
+
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertNotIn('count', last)
+
+        backwards, first = self.walk(last['previous'], 'previous')
+        self.assertEqual(backwards, pages[-2::-1])
+        self.assertIsNone(first['previous'])
+
+    def test_rows_inserted_meanwhile_do_not_shift_the_pages(self):
+        response = self.client.get('/api/guests/?page_size=3')
+        Guest.objects.create(
+            first_name='Late',
+            last_name='Guest',
+            date_of_birth=self.today.replace(year=1990),
+            address='Address',
+            phone='020 0000 0000',
+            email='late@example.com',
+        )
+
+        response = self.client.get(response.data['next'])
+
+        self.assertEqual([guest['id'] for guest in response.data['results']], self.expected[3:6])
+
+    def test_count_on_request(self):
+        response = self.client.get('/api/guests/', {'page_size': 3, 'count': 'true'})
+
+        self.assertEqual(response.data['count'], len(self.expected))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/guests/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class KpiApiTests(HotelApiTestCase):
+    def kpis(self, **params):
+        response = self.client.get(
+            '/api/hotels/kpis/', {'start_date': self.days(10), 'end_date': self.days(13), **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {entry['hotel']: entry for entry in response.data['hotels']}
+
+    def test_kpis(self):
+        other_hotel = Hotel.objects.create(
+            name='Other', stars=4, check_in_time=time(14), check_out_time=time(11)
+        )
+        other_room = Room.objects.create(
+            hotel=other_hotel, room_type=self.room_type, room_number='O1'
+        )
+        empty_hotel = Hotel.objects.create(
+            name='Empty', stars=2, check_in_time=time(14), check_out_time=time(11)
+        )
+        Room.objects.create(hotel=empty_hotel, room_type=self.room_type, room_number='E1')
+
+        # The range holds the nights of days 10 to 13
+        self.book(self.rooms[0], 8, 11, total_price=300)  # Straddles the start
+        self.book(self.rooms[0], 11, 12, total_price=160)
+        self.book(self.rooms[1], 12, 16, total_price=480)  # Straddles the end
+        self.book(self.rooms[2], 1, 3, total_price=200)  # Before the range
+        self.book(other_room, 9, 15, total_price=900)  # Covers it, 150 a night
+        # A room removed without its bookings is not counted
+        removed = Room.objects.create(hotel=self.hotel, room_type=self.room_type, room_number='X')
+        self.book(removed, 10, 14, total_price=400)
+        Room.objects.filter(pk=removed.pk).update(is_deleted=True)
+
+        kpis = self.kpis()
+        self.assertEqual(set(kpis), {self.hotel.pk, other_hotel.pk, empty_hotel.pk})
+
+        hotel = kpis[self.hotel.pk]
+        self.assertEqual(hotel['rooms'], 3)
+        self.assertEqual(hotel['occupancy'], [33.33, 33.33, 33.33, 33.33])
+        self.assertEqual(hotel['adr'], [100, 160, 120, 120])
+        self.assertEqual(hotel['revpar'], [33.33, 53.33, 40, 40])
+        self.assertEqual(
+            hotel['totals'],
+            {
+                'room_nights_sold': 4,
+                'revenue': 500,
+                'occupancy': 33.33,
+                'adr': 125,
+                'revpar': 41.67,
+            },
+        )
+
+        other = kpis[other_hotel.pk]
+        self.assertEqual(other['occupancy'], [100, 100, 100, 100])
+        self.assertEqual(other['adr'], [150, 150, 150, 150])
+        self.assertEqual(other['totals']['revenue'], 600)
+
+        empty = kpis[empty_hotel.pk]
+        self.assertEqual(empty['occupancy'], [0, 0, 0, 0])
+        self.assertEqual(empty['adr'], [None, None, None, None])
+        self.assertEqual(empty['revpar'], [0, 0, 0, 0])
+        self.assertEqual(
+            empty['totals'],
+            {'room_nights_sold': 0, 'revenue': 0, 'occupancy': 0, 'adr': None, 'revpar': 0},
+        )
+
+        # One hotel, the bookings of the others are left out
+        self.assertEqual(list(self.kpis(hotel=other_hotel.pk)), [other_hotel.pk])
+        self.assertEqual(self.kpis(hotel=other_hotel.pk)[other_hotel.pk], other)
+
+    def test_invalid_range(self):
+        response = self.client.get(
+            '/api/hotels/kpis/', {'start_date': self.days(0), 'end_date': self.days(800)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityApiTests(HotelApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        suite_type = RoomType.objects.create(name='Suite', price_per_night=250, capacity=4)
+        cls.suite = Room.objects.create(hotel=cls.hotel, room_type=suite_type, room_number='S1')
+        cls.other_hotel = Hotel.objects.create(
+            name='Other', stars=4, check_in_time=time(14), check_out_time=time(11)
+        )
+        cls.other_room = Room.objects.create(
+            hotel=cls.other_hotel, room_type=cls.room_type, room_number='O1'
+        )
+        # The first night of the double rooms is discounted, 50 + 100 for the stay
+        RoomRate.objects.create(
+            room_type=cls.room_type, date=cls.today + timedelta(days=1), price=50
+        )
+
+    def search(self, **params):
+        return self.client.get(
+            '/api/rooms/availability/',
+            {'check_in_date': self.days(1), 'check_out_date': self.days(3), **params},
+        )
+
+    def room_numbers(self, **params):
+        response = self.search(**params)
+        self.assertEqual(response.status_code, 200)
+        return [room['room_number'] for room in response.data['results']]
+
+    def test_priced_cheapest_first(self):
+        self.book(self.rooms[0], 2, 4)
+
+        response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['nights'], 2)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(
+            [(room['room_number'], room['total_price']) for room in response.data['results']],
+            [('O1', 150), ('R1', 150), ('R2', 150), ('S1', 500)],
+        )
+
+    def test_filters(self):
+        self.assertEqual(self.room_numbers(capacity=3), ['S1'])
+        self.assertEqual(self.room_numbers(capacity=5), [])
+        self.assertEqual(self.room_numbers(room_type=self.suite.room_type_id), ['S1'])
+        self.assertEqual(self.room_numbers(hotel=self.other_hotel.pk), ['O1'])
+        self.assertEqual(
+            self.room_numbers(hotel=self.hotel.pk, capacity=2), ['R0', 'R1', 'R2', 'S1']
+        )
+
+    def test_paginated(self):
+        first = self.search(page_size=3)
+        self.assertEqual(first.data['count'], 5)
+        self.assertEqual(len(first.data['results']), 3)
+        self.assertIsNone(first.data['previous'])
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual([room['room_number'] for room in second.data['results']], ['R2', 'S1'])
+        self.assertIsNone(second.data['next'])
+
+    def test_invalid_parameters(self):
+        cases = {
+            'missing dates': {'check_in_date': ''},
+            'same dates': {'check_out_date': self.days(1)},
+            'check-out first': {'check_out_date': self.days(0)},
+            'hotel': {'hotel': 'main'},
+            'capacity': {'capacity': 'two'},
+        }
+        for name, params in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.search(**params).status_code, 400)
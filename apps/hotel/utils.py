@@ -0,0 +1,32 @@
+from datetime import datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_date_range(query_params, start_param='start_date', end_param='end_date'):
+    start_date = query_params.get(start_param)
+    end_date = query_params.get(end_param)
+
+    if not start_date or not end_date:
+        raise ValidationError(f"Both '{start_param}' and '{end_param}' are required.")
+
+    try:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError("Invalid date format. Use 'YYYY-MM-DD'.")
+
+    if start_date > end_date:
+        raise ValidationError(f"'{start_param}' must be before '{end_param}'.")
+
+    return start_date, end_date
+
+
+def parse_int_param(query_params, name):
+    value = query_params.get(name)
+    if value in (None, ''):
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"'{name}' must be an integer.")
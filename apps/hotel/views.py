@@ -1,25 +1,51 @@
-from django.db import transaction
-from django.db.models import Sum
-from django.utils import timezone
+from django.db.models import Case, Count, DecimalField, Sum, Value, When
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework import status
-from datetime import datetime
-from .models import Hotel, Staff, Guest, RoomType, Room, Booking, Payment
+from rest_framework.settings import api_settings
+from .models import (
+    Hotel,
+    Staff,
+    Guest,
+    RoomType,
+    RoomRate,
+    Room,
+    Booking,
+    Payment,
+    DailyRevenue,
+    DailyPaymentTotal,
+)
 from .serializers import (
     HotelSerializer,
     StaffSerializer,
     GuestSerializer,
     RoomTypeSerializer,
+    RoomRateSerializer,
     RoomSerializer,
     BookingSerializer,
+    BulkBookingSerializer,
     PaymentSerializer,
 )
 from common.viewsets.base_viewsets import BaseModelViewSet
 from common.mixins import SoftDeleteMixin
+from common.pagination import StandardResultsSetPagination
+from common.renderers import CSVRenderer, NDJSONRenderer
 from .permissions import HotelPermissions, StaffPermissions
+from .availability import available_rooms
+from .analytics import hotel_kpis
+from .services import create_booking, create_bookings_bulk
+from .rates import stay_price
+from .utils import parse_date_range, parse_int_param
+from .reports import (
+    BOOKING_REPORT_FIELDS,
+    grouped_booking_report,
+    parse_group_by,
+    stream_booking_report_csv,
+    stream_booking_report_ndjson,
+)
 
 
 class HotelViewSet(BaseModelViewSet, SoftDeleteMixin):
@@ -27,6 +53,31 @@ class HotelViewSet(BaseModelViewSet, SoftDeleteMixin):
     serializer_class = HotelSerializer
     permission_classes = [HotelPermissions]
 
+    KPI_MAX_DAYS = 731
+
+    @action(detail=False, methods=['get'], url_path='kpis', permission_classes=[IsAuthenticated])
+    def kpis(self, request):
+        """
+        Occupancy (%), ADR and RevPAR per hotel for every day of the range.
+        """
+        start_date, end_date = parse_date_range(request.query_params)
+        days = (end_date - start_date).days + 1
+
+        if days > self.KPI_MAX_DAYS:
+            raise ValidationError(f'The date range cannot exceed {self.KPI_MAX_DAYS} days.')
+
+        return Response(
+            {
+                'start_date': start_date,
+                'end_date': end_date,
+                'days': days,
+                'hotels': hotel_kpis(
+                    start_date, end_date, hotel=parse_int_param(request.query_params, 'hotel')
+                ),
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class StaffViewSet(BaseModelViewSet, SoftDeleteMixin):
     queryset = Staff.objects.all()
@@ -44,82 +95,243 @@ class RoomTypeViewSet(BaseModelViewSet, SoftDeleteMixin):
     serializer_class = RoomTypeSerializer
 
 
+class RoomRateViewSet(BaseModelViewSet, SoftDeleteMixin):
+    queryset = RoomRate.objects.all()
+    serializer_class = RoomRateSerializer
+
+
 class RoomViewSet(BaseModelViewSet, SoftDeleteMixin):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
 
+    @action(detail=False, methods=['get'], url_path='availability')
+    def availability(self, request):
+        """
+        Search the rooms that are free for a stay, priced for the whole stay.
+
+        The rooms of every hotel match unless `hotel` is given, the results are paginated
+        by `page` and `page_size`, cheapest first.
+        """
+        check_in_date, check_out_date = parse_date_range(
+            request.query_params, 'check_in_date', 'check_out_date'
+        )
+
+        if check_out_date == check_in_date:
+            raise ValidationError("'check_out_date' must be after 'check_in_date'.")
+
+        rooms = available_rooms(
+            check_in_date,
+            check_out_date,
+            hotel=parse_int_param(request.query_params, 'hotel'),
+            room_type=parse_int_param(request.query_params, 'room_type'),
+            capacity=parse_int_param(request.query_params, 'capacity'),
+        )
+
+        # Rooms of the same type cost the same, price each type once from the rate calendar
+        # and sort the rooms by price in the query, so they can be paginated
+        prices = {
+            room_type.pk: stay_price(room_type, check_in_date, check_out_date)
+            for room_type in RoomType.objects.filter(pk__in=rooms.values('room_type_id'))
+        }
+        rooms = rooms.annotate(
+            total_price=Case(
+                *[When(room_type=pk, then=Value(price)) for pk, price in prices.items()],
+                output_field=DecimalField(max_digits=9, decimal_places=2),
+            )
+        ).order_by('total_price', 'room_number', 'pk')
+
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        results = [
+            {
+                'id': room.pk,
+                'room_number': room.room_number,
+                'hotel': room.hotel_id,
+                'room_type': room.room_type.pk,
+                'room_type__name': room.room_type.name,
+                'room_type__capacity': room.room_type.capacity,
+                'room_type__price_per_night': room.room_type.price_per_night,
+                'total_price': room.total_price,
+            }
+            for room in page
+        ]
+
+        return Response(
+            {
+                'check_in_date': check_in_date,
+                'check_out_date': check_out_date,
+                'nights': (check_out_date - check_in_date).days,
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+                'results': results,
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class BookingViewSet(BaseModelViewSet, SoftDeleteMixin):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
 
     def create(self, request, *args, **kwargs):
-        payment_method = request.data.get('payment_method', Payment.PAYMENT_METHOD_CASH)
-
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        with transaction.atomic():
-            self.perform_create(serializer)
-            instance = serializer.instance
-
-            # Create payment upon successful booking
-            Payment.objects.create(
-                booking=instance,
-                amount=instance.total_price,
-                payment_date=timezone.now(),
-                payment_method=payment_method,  # Use provided payment method or default to cash
-            )
+        # Create the booking and its payment in one transaction
+        data = serializer.validated_data
+        serializer.instance = create_booking(
+            data['guest'],
+            data['room'],
+            data['check_in_date'],
+            data['check_out_date'],
+            payment_method=data['payment_method'],  # Provided payment method or cash
+        )
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @action(detail=False, methods=['get'], url_path='report', permission_classes=[IsAuthenticated])
+    def get_serializer_class(self):
+        if self.action == 'bulk':
+            return BulkBookingSerializer
+        return super().get_serializer_class()
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Book a group of rooms in one request, with one result per row.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = create_bookings_bulk(serializer.validated_data['bookings'])
+
+        created = 0
+        for result in results:
+            if result['status'] == 'created':
+                result['booking'] = BookingSerializer(result['booking']).data
+                created += 1
+
+        return Response(
+            {
+                'created': created,
+                'rejected': len(results) - created,
+                'results': results,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='report',
+        permission_classes=[IsAuthenticated],
+        renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [CSVRenderer, NDJSONRenderer],
+    )
     def report(self, request):
         """
         Generate a report of bookings.
+
+        The report covers the stays within the range, checked in and out between the two
+        dates, so it reads the booking rows. The rollups attribute a booking to its
+        check-in date only and can't tell whether the stay ends in the range: the totals
+        over a range, by day or payment method, are served from them by `revenue`.
+
+        Use `?format=csv` or `?format=ndjson` to stream the rows instead of building
+        the whole report in memory, the totals are then appended after the rows.
+
+        Use `?group_by=hotel,room_type,payment_method,month` (any subset, in any order)
+        to get the totals of every grouping level instead of the rows.
         """
         # Customize the reporting logic as needed
         # For example, filter by date range, group by room type, etc.
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        start_date, end_date = parse_date_range(request.query_params)
 
-        bookings = self.queryset
+        bookings = self.queryset.filter(check_in_date__gte=start_date, check_out_date__lte=end_date)
 
-        if not start_date or not end_date:
-            raise ValidationError("Both 'start_date' and 'end_date' are required.")
+        group_by = request.query_params.get('group_by')
+        if group_by is not None:
+            report = grouped_booking_report(bookings, parse_group_by(group_by))
+            if request.accepted_renderer.format in (CSVRenderer.format, NDJSONRenderer.format):
+                report = [dict(zip(report['columns'], row)) for row in report['rows']]
+            return Response(report, status=status.HTTP_200_OK)
 
-        try:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-        except ValueError:
-            raise ValidationError("Invalid date format. Use 'YYYY-MM-DD'.")
+        streams = {
+            CSVRenderer.format: stream_booking_report_csv,
+            NDJSONRenderer.format: stream_booking_report_ndjson,
+        }
+        renderer = request.accepted_renderer
+        if renderer.format in streams:
+            response = StreamingHttpResponse(
+                streams[renderer.format](bookings),
+                content_type=f'{renderer.media_type}; charset={renderer.charset}',
+            )
+            filename = f'bookings-report-{start_date}-{end_date}.{renderer.format}'
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
 
-        if start_date > end_date:
-            raise ValidationError("'start_date' must be before 'end_date'.")
+        report_data = bookings.values(*BOOKING_REPORT_FIELDS)
 
-        bookings = self.queryset.filter(check_in_date__gte=start_date, check_out_date__lte=end_date)
+        # Count the bookings within the specified range and sum their total_price
+        totals = bookings.aggregate(total_bookings=Count('id'), total_sum=Sum('total_price'))
 
-        report_data = bookings.values(
-            'guest__first_name',
-            'guest__last_name',
-            'room__room_number',
-            'check_in_date',
-            'check_out_date',
-            'total_price',
+        return Response(
+            {
+                'report': report_data,
+                'total_bookings': totals['total_bookings'],
+                'total_sum': totals['total_sum'],
+            },
+            status=status.HTTP_200_OK,
         )
 
-        # Calculate the total sum of all total_price
-        total_sum = bookings.aggregate(total_sum=Sum('total_price'))['total_sum']
+    @action(detail=False, methods=['get'], url_path='revenue', permission_classes=[IsAuthenticated])
+    def revenue(self, request):
+        """
+        Daily revenue and payment totals, read from the rollup tables.
 
-        # Count the number of bookings within the specified range
-        booking_count = bookings.count()
+        Bookings are attributed to their check-in date and payments to their payment
+        date, so the query reads at most one row per day, hotel and room type. Unlike
+        `report`, a stay starting in the range counts even if it ends after it.
+        """
+        start_date, end_date = parse_date_range(request.query_params)
+        hotel = parse_int_param(request.query_params, 'hotel')
+
+        revenue = DailyRevenue.objects.filter(
+            date__range=(start_date, end_date),
+            hotel__is_deleted=False,
+            room_type__is_deleted=False,
+        )
+        payments = DailyPaymentTotal.objects.filter(
+            date__range=(start_date, end_date),
+            hotel__is_deleted=False,
+            room_type__is_deleted=False,
+        )
+        if hotel is not None:
+            revenue = revenue.filter(hotel=hotel)
+            payments = payments.filter(hotel=hotel)
+
+        daily = list(
+            revenue.values('date')
+            .annotate(
+                bookings=Sum('bookings'),
+                room_nights=Sum('room_nights'),
+                revenue=Sum('revenue'),
+            )
+            .order_by('date')
+        )
+        payment_methods = (
+            payments.values('payment_method')
+            .annotate(payments=Sum('payments'), amount=Sum('amount'))
+            .order_by('payment_method')
+        )
 
         return Response(
             {
-                'report': report_data,
-                'total_bookings': booking_count,
-                'total_sum': total_sum,
+                'total_bookings': sum(day['bookings'] for day in daily),
+                'total_room_nights': sum(day['room_nights'] for day in daily),
+                'total_revenue': sum(day['revenue'] for day in daily),
+                'payments': payment_methods,
+                'daily': daily,
             },
             status=status.HTTP_200_OK,
         )
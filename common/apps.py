@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'common'
+
+    def ready(self):
+        from . import checks
+        from .models.soft_delete_models import build_relation_graph
+
+        build_relation_graph()
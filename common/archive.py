@@ -0,0 +1,181 @@
+"""
+Archival of long soft deleted rows.
+
+Rows soft deleted more than `archive_after_days` ago are moved from their table to
+`ArchivedRow` in small batches, each in its own short transaction, so the live tables
+and their indexes only hold the rows that can still be restored often. Archived rows
+are put back in their table by `unarchive`, after which the usual `restore` applies.
+"""
+
+import logging
+import time
+from datetime import timedelta
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import ArchivedRow
+from .models.soft_delete_models import SoftDeleteModel, get_settings, get_soft_delete_relations
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500
+# Pause between two batches, to leave room to the application queries
+ARCHIVE_BATCH_PAUSE = 0.1
+
+
+def archival_order():
+    """
+    Soft delete models with the children before their parents.
+    """
+    ordered = []
+
+    def visit(model, path):
+        if model in ordered or model in path:
+            return
+        for related_model, _ in get_soft_delete_relations(model):
+            visit(related_model, path + (model,))
+        ordered.append(model)
+
+    for model in apps.get_models():
+        if issubclass(model, SoftDeleteModel):
+            visit(model, ())
+    return ordered
+
+
+def archivable(model, cutoff):
+    """
+    Rows of `model` soft deleted before `cutoff` that no soft delete row points to.
+
+    The children of a cascade are archived first, a row still referenced by a live
+    or deleted child stays in its table until the child is archived.
+    """
+    rows = model.deleted_objects.filter(deleted_at__lt=cutoff)
+    for related_model, field_name in get_soft_delete_relations(model):
+        rows = rows.exclude(Exists(related_model.all_objects.filter(**{field_name: OuterRef('pk')})))
+    return rows
+
+
+def archive_batch(model, pks):
+    with transaction.atomic():
+        rows = list(model.all_objects.filter(pk__in=pks, is_deleted=True).select_for_update())
+        content_type = ContentType.objects.get_for_model(model)
+        ArchivedRow.objects.bulk_create(
+            [
+                ArchivedRow(
+                    content_type=content_type,
+                    object_id=dumped['pk'],
+                    deleted_at=row.deleted_at,
+                    data=dumped['fields'],
+                )
+                for row, dumped in zip(rows, serializers.serialize('python', rows))
+            ]
+        )
+        # `all_objects` is a plain manager, its delete() removes the rows
+        model.all_objects.filter(pk__in=[row.pk for row in rows]).delete()
+    return len(rows)
+
+
+def archive_soft_deleted(days=None, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE):
+    """
+    Archive the rows soft deleted more than `days` ago, keyset-chunked on the primary key.
+    """
+    if days is None:
+        days = get_settings().get('archive_after_days', 90)
+    cutoff = timezone.now() - timedelta(days=days)
+
+    archived = {}
+    for model in archival_order():
+        rows = archivable(model, cutoff).order_by('pk').values_list('pk', flat=True)
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            pks = list(batch[:batch_size])
+            if not pks:
+                break
+
+            count = archive_batch(model, pks)
+            if count:
+                archived[model._meta.label] = archived.get(model._meta.label, 0) + count
+            last_pk = pks[-1]
+            time.sleep(pause)
+
+    logger.info('Archived the rows soft deleted before %s: %s', cutoff, archived)
+    return archived
+
+
+def _deserialize(archived_rows):
+    return serializers.deserialize(
+        'python',
+        [
+            {
+                'model': archived.content_type.model_class()._meta.label_lower,
+                'pk': archived.object_id,
+                'fields': archived.data,
+            }
+            for archived in archived_rows
+        ],
+    )
+
+
+def _put_back(archived_rows):
+    for archived, deserialized in zip(archived_rows, _deserialize(archived_rows)):
+        # The JSON encoder keeps milliseconds only, `deleted_at` identifies the batch
+        deserialized.object.deleted_at = archived.deleted_at
+        deserialized.save()
+    ArchivedRow.objects.filter(pk__in=[archived.pk for archived in archived_rows]).delete()
+
+
+@transaction.atomic
+def unarchive(model, pk):
+    """
+    Put the archived rows of the deletion batch of a row back in their tables, still
+    soft deleted, so that `restore` finds them.
+
+    The row itself may be archived or not, its children from the same batch may have
+    been archived without it. Returns the row, or None if it exists nowhere.
+    """
+    instance = model.all_objects.filter(pk=pk).first()
+    if instance is None:
+        archived = (
+            ArchivedRow.objects.select_related('content_type')
+            .filter(content_type=ContentType.objects.get_for_model(model), object_id=pk)
+            .first()
+        )
+        if archived is None:
+            return None
+        _put_back([archived])
+        instance = model.all_objects.get(pk=pk)
+
+    if instance.is_deleted:
+        _unarchive_related(model, [instance.pk], instance.deleted_at, (model,))
+    return instance
+
+
+def _unarchive_related(model, pks, deleted_at, path):
+    # Parents go first, the rows of the children point to them
+    for related_model, field_name in get_soft_delete_relations(model):
+        if related_model in path:
+            continue
+
+        archived = list(
+            ArchivedRow.objects.select_related('content_type').filter(
+                content_type=ContentType.objects.get_for_model(related_model),
+                deleted_at=deleted_at,
+                **{f'data__{field_name}__in': pks},
+            )
+        )
+        if archived:
+            _put_back(archived)
+
+        # Rows of the batch still in the table may have archived children as well
+        related_pks = list(
+            related_model.deleted_objects.filter(
+                deleted_at=deleted_at, **{f'{field_name}__in': pks}
+            ).values_list('pk', flat=True)
+        )
+        if related_pks:
+            _unarchive_related(related_model, related_pks, deleted_at, path + (related_model,))
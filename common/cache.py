@@ -0,0 +1,27 @@
+"""
+Version numbers kept in the shared cache to invalidate derived data at once.
+
+The data cached under a version (in the shared cache or per process) is dropped by
+bumping the version instead of deleting every entry. A version that is unknown, on
+first use or once evicted, restarts from the current time, so it can't be one that
+data was already cached under.
+"""
+
+import time
+from django.core.cache import cache
+
+
+def cache_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        # Another process may have added it first
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_cache_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
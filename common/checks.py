@@ -0,0 +1,51 @@
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from common.models.base_models import BaseModel
+from common.media import MEDIA_DELIVERIES
+
+
+@checks.register(checks.Tags.models, checks.Tags.database)
+def check_soft_delete_indexes(app_configs=None, **kwargs):
+    """
+    Every BaseModel table needs the partial indexes declared in `BaseModel.Meta`.
+
+    A model overriding `Meta.indexes` drops them silently, the next makemigrations
+    would then remove them from its table.
+    """
+    expected = {index.name for index in BaseModel.Meta.indexes}
+    if app_configs is None:
+        models = apps.get_models()
+    else:
+        models = [model for app_config in app_configs for model in app_config.get_models()]
+
+    errors = []
+    for model in models:
+        if not issubclass(model, BaseModel) or model._meta.proxy:
+            continue
+
+        names = {'app_label': model._meta.app_label.lower(), 'class': model.__name__.lower()}
+        expected_names = {name % names for name in expected}
+        missing = sorted(expected_names - {index.name for index in model._meta.indexes})
+        if missing:
+            errors.append(
+                checks.Error(
+                    f'{model._meta.label} is missing the soft delete indexes {", ".join(missing)}.',
+                    hint='Add *BaseModel.Meta.indexes to Meta.indexes.',
+                    obj=model,
+                    id='common.E001',
+                )
+            )
+    return errors
+
+
+@checks.register()
+def check_media_delivery(app_configs=None, **kwargs):
+    if settings.MEDIA_DELIVERY not in MEDIA_DELIVERIES:
+        return [
+            checks.Error(
+                f'MEDIA_DELIVERY must be one of {", ".join(MEDIA_DELIVERIES)}.',
+                id='common.E002',
+            )
+        ]
+    return []
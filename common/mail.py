@@ -0,0 +1,177 @@
+"""
+Transactional emails through an outbox.
+
+`queue_email` writes an `OutboxEmail` row in the transaction of the caller, so the email
+only exists if the changes it is about are committed, and queues
+common.tasks.send_queued_emails once it commits. The task claims the due emails in
+batches and sends each batch over one connection to the email backend, outside of any
+transaction, then retries the failed ones later with an exponential backoff. The beat
+sweep sends whatever could not be queued, and the sent rows are purged after
+EMAIL_RETENTION. The templates are compiled once per worker by the cached template loader.
+"""
+
+import logging
+from datetime import timedelta
+from kombu.exceptions import OperationalError
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils import timezone
+from .models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 5
+# Delay in seconds before the first retry, doubled at each attempt
+EMAIL_RETRY_DELAY = 60
+# Seconds a worker has to send the emails it claimed, they are claimed again afterwards
+EMAIL_CLAIM_TIMEOUT = 10 * 60
+# The sent emails are kept this long, e.g. to look into a complaint
+EMAIL_RETENTION = timedelta(days=7)
+
+
+def queue_email(template_name, context, to, subject, from_email=''):
+    """
+    Write an email to the outbox in the current transaction, sent once it commits.
+    """
+    email = OutboxEmail.objects.create(
+        subject=subject,
+        from_email=from_email,
+        to=list(to),
+        template_name=template_name,
+        context=context,
+    )
+    transaction.on_commit(_queue_sending)
+    return email
+
+
+def _queue_sending():
+    from .tasks import send_queued_emails
+
+    try:
+        send_queued_emails.delay()
+    except OperationalError:
+        # The broker is unreachable, the beat sweep sends the email
+        logger.warning('Could not queue the sending of the outbox emails')
+
+
+def render_email(email):
+    context = email.context
+    message = EmailMultiAlternatives(
+        email.subject,
+        get_template(f'{email.template_name}.txt').render(context),
+        email.from_email or None,
+        email.to,
+    )
+    try:
+        html_template = get_template(f'{email.template_name}.html')
+    except TemplateDoesNotExist:
+        return message
+    message.attach_alternative(html_template.render(context), 'text/html')
+    return message
+
+
+def _send(email, connection):
+    email.attempts += 1
+    try:
+        message = render_email(email)
+        message.connection = connection
+        message.send()
+    except Exception as e:
+        # Any failure of one email, the rest of the batch is still sent
+        email.last_error = f'{type(e).__name__}: {e}'
+        if email.attempts >= EMAIL_MAX_ATTEMPTS:
+            email.status = OutboxEmail.Status.FAILED
+            logger.error('Gave up sending the outbox email %s: %s', email.pk, email.last_error)
+        else:
+            delay = EMAIL_RETRY_DELAY * 2 ** (email.attempts - 1)
+            email.status = OutboxEmail.Status.PENDING
+            email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            logger.warning('Could not send the outbox email %s: %s', email.pk, email.last_error)
+    else:
+        email.status = OutboxEmail.Status.SENT
+        email.sent_at = timezone.now()
+        email.last_error = ''
+        # Not needed anymore, and it may hold secrets
+        email.context = {}
+
+
+def claim_batch(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Claim the next due emails for EMAIL_CLAIM_TIMEOUT, in a short transaction.
+
+    Concurrent workers skip the rows locked by each other. The emails claimed by a
+    worker that did not finish sending them are due again once their claim expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.filter(
+                status__in=[OutboxEmail.Status.PENDING, OutboxEmail.Status.SENDING],
+                next_attempt_at__lte=now,
+            )
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status=OutboxEmail.Status.SENDING,
+            next_attempt_at=now + timedelta(seconds=EMAIL_CLAIM_TIMEOUT),
+        )
+    return emails
+
+
+def send_batch(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Send the next due emails over one connection, returns them with their new status.
+
+    No row is locked while sending. If the email backend can't be reached the error is
+    raised and the emails not sent yet are put back as they were before the claim.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return []
+
+    try:
+        with get_connection() as connection:
+            for email in emails:
+                _send(email, connection)
+    finally:
+        OutboxEmail.objects.bulk_update(
+            emails,
+            ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'context'],
+        )
+    return emails
+
+
+def send_queued(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Send the due emails of the outbox batch by batch, the failed ones are not due again
+    until their next attempt.
+    """
+    counts = {}
+    while True:
+        emails = send_batch(batch_size)
+        if not emails:
+            break
+        for email in emails:
+            status = 'retrying' if email.status == OutboxEmail.Status.PENDING else str(email.status)
+            counts[status] = counts.get(status, 0) + 1
+
+    if counts:
+        logger.info('Sent the outbox emails: %s', counts)
+    return counts
+
+
+def purge_sent(retention=EMAIL_RETENTION):
+    """
+    Delete the emails sent more than `retention` ago.
+    """
+    count, _ = OutboxEmail.objects.filter(
+        status=OutboxEmail.Status.SENT, sent_at__lt=timezone.now() - retention
+    ).delete()
+    if count:
+        logger.info('Purged %s sent outbox emails', count)
+    return count
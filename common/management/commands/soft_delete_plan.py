@@ -0,0 +1,52 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from common.models.soft_delete_models import SoftDeleteModel, get_soft_delete_relations
+from common.pagination import estimated_count
+
+
+class Command(BaseCommand):
+    help = 'Print the tables a soft delete of a model cascades to, with estimated row counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='The model as app_label.ModelName, e.g. hotel.Hotel')
+        parser.add_argument(
+            '--ids', nargs='+', type=int, help='Only the rows with these ids (all live rows by default)'
+        )
+        parser.add_argument(
+            '--no-counts', action='store_true', help='Print the plan without the row counts'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        if not issubclass(model, SoftDeleteModel):
+            raise CommandError(f'{model._meta.label} is not a soft delete model.')
+
+        queryset = model.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+
+        self.counts = not options['no_counts']
+        self.print_step(model, queryset, None, 0)
+        self.print_plan(model, queryset, (model,), 1)
+
+    def print_step(self, model, queryset, field_name, depth):
+        line = '  ' * depth + model._meta.label
+        if field_name is not None:
+            line += f' (by {field_name})'
+        if self.counts:
+            # The planner's estimate on PostgreSQL, the deep steps are joins over large tables
+            line += f': ~{estimated_count(queryset)} rows'
+        self.stdout.write(line)
+
+    def print_plan(self, model, queryset, path, depth):
+        for related_model, field_name in get_soft_delete_relations(model):
+            if related_model in path:
+                self.stdout.write('  ' * depth + f'{related_model._meta.label} (cycle, skipped)')
+                continue
+
+            related = related_model.objects.filter(**{f'{field_name}__in': queryset.values('pk')})
+            self.print_step(related_model, related, field_name, depth)
+            self.print_plan(related_model, related, path + (related_model,), depth + 1)
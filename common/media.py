@@ -0,0 +1,118 @@
+"""
+Delivery of the user uploaded media (MEDIA_ROOT).
+
+The bytes of a file never go through Python. Depending on MEDIA_DELIVERY the response
+hands the file over to the web server in front of Django, with X-Accel-Redirect (nginx)
+or X-Sendfile (Apache, lighttpd), or is a FileResponse the WSGI server sends with
+sendfile() through wsgi.file_wrapper. For nginx, MEDIA_ACCEL_REDIRECT_PREFIX is an
+internal location aliasing MEDIA_ROOT:
+
+    location /protected-media/ {
+        internal;
+        alias /path/to/mediafiles/;
+    }
+
+Responses carry an ETag and conditional requests are answered with a 304. A file is
+never hashed on a request: the content-addressed files of MEDIA_IMMUTABLE_PATHS (the
+avatar renditions) are named after the hash of their content, and they are cached for
+a year. The others are revalidated, with the hash recorded when the file was written
+(see store_content_etag) or else a weak ETag of the modification time and size.
+"""
+
+import hashlib
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+
+MEDIA_DELIVERIES = ('django', 'x-accel-redirect', 'x-sendfile')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# The other files may be replaced under the same name
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+ETAG_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _is_immutable(path):
+    return path.startswith(tuple(settings.MEDIA_IMMUTABLE_PATHS))
+
+
+def _etag_key(full_path, file_stat):
+    # Per version of the file, a replaced file gets a new key
+    version = f'{full_path}:{file_stat.st_mtime_ns}:{file_stat.st_size}'
+    return f'media:etag:{hashlib.md5(version.encode()).hexdigest()}'
+
+
+def store_content_etag(name, digest):
+    """
+    Record the hash of the content of the media file `name`, computed when it was written.
+    """
+    full_path = safe_join(settings.MEDIA_ROOT, name)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
+        return
+    cache.set(_etag_key(full_path, file_stat), f'"{digest}"', timeout=ETAG_CACHE_TIMEOUT)
+
+
+def content_etag(path, full_path, file_stat):
+    """
+    The ETag of a file, without reading it.
+    """
+    if _is_immutable(path):
+        # Named `<hash>_<variant>.<extension>`, see apps.accounts.tasks.process_avatar
+        digest = os.path.basename(path).split('_', 1)[0]
+        return f'"{digest}"'
+
+    etag = cache.get(_etag_key(full_path, file_stat))
+    if etag is None:
+        etag = f'W/"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+    return etag
+
+
+def _file_response(path, full_path):
+    if settings.MEDIA_DELIVERY == 'django':
+        return FileResponse(open(full_path, 'rb'))
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    if settings.MEDIA_DELIVERY == 'x-accel-redirect':
+        response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+    else:
+        response.headers['X-Sendfile'] = full_path
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    full_path = safe_join(settings.MEDIA_ROOT, path)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
+        raise Http404('File not found')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('File not found')
+
+    etag = content_etag(path, full_path, file_stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime)
+    )
+    if response is None:
+        response = _file_response(path, full_path)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(file_stat.st_mtime)
+    if _is_immutable(path):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_outboxemail'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxemail',
+            name='common_outbox_pending_idx',
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'sending'])), fields=['next_attempt_at', 'id'], name='common_outbox_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(condition=models.Q(('status', 'sent')), fields=['sent_at'], name='common_outbox_sent_idx'),
+        ),
+    ]
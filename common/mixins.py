@@ -1,7 +1,10 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from .archive import unarchive
 from .exceptions import NotFoundError
+from .uploads import ImageUploadGuard
 
 
 class SoftDeleteMixin:
@@ -16,13 +19,17 @@ class SoftDeleteMixin:
         self.check_object_permissions(self.request, obj)
         return obj
 
-    def _get_instance_or_404(self, pk):
-        try:
-            instance = self.queryset.model.all_objects.get(pk=pk)
-            self.check_object_permissions(self.request, instance)
-            return instance
-        except self.queryset.model.DoesNotExist:
-            raise NotFoundError(f"{self.queryset.model.__name__} not found")
+    def _get_instance_or_404(self, pk, archived=False):
+        model = self.queryset.model
+        if archived:
+            # Rows soft deleted long ago may have been moved to the archive (see common.archive)
+            instance = unarchive(model, pk)
+        else:
+            instance = model.all_objects.filter(pk=pk).first()
+        if instance is None:
+            raise NotFoundError(f"{model.__name__} not found")
+        self.check_object_permissions(self.request, instance)
+        return instance
 
     @action(detail=False, methods=['get'], url_path='soft-delete')
     def soft_delete(self, request):
@@ -40,12 +47,15 @@ class SoftDeleteMixin:
 
     @action(detail=True, methods=['post'], url_path='restore')
     def restore(self, request, pk=None):
-        instance = self._get_instance_or_404(pk)
-        if instance.is_deleted:
-            instance.restore()
-            return Response(
-                {'status': f'{self.queryset.model.__name__} restored'}, status=status.HTTP_200_OK
-            )
+        # An archived row is put back in its table first, undone if the restore fails
+        with transaction.atomic():
+            instance = self._get_instance_or_404(pk, archived=True)
+            if instance.is_deleted:
+                instance.restore()
+                return Response(
+                    {'status': f'{self.queryset.model.__name__} restored'},
+                    status=status.HTTP_200_OK,
+                )
         return Response(
             {'status': f'{self.queryset.model.__name__} is not deleted'},
             status=status.HTTP_400_BAD_REQUEST,
@@ -59,3 +69,18 @@ class SoftDeleteMixin:
             {'status': f'{self.queryset.model.__name__} permanently deleted'},
             status=status.HTTP_204_NO_CONTENT,
         )
+
+
+class ImageUploadGuardMixin:
+    """
+    Check the uploads of `image_upload_fields` while they are received (see common.uploads).
+    """
+
+    image_upload_fields = ()
+
+    def initial(self, request, *args, **kwargs):
+        # Before the body is parsed, the handlers can't be changed afterwards
+        request._request.upload_handlers.insert(
+            0, ImageUploadGuard(request._request, self.image_upload_fields)
+        )
+        super().initial(request, *args, **kwargs)
@@ -0,0 +1,2 @@
+from .archive_models import ArchivedRow
+from .email_models import OutboxEmail
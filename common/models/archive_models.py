@@ -0,0 +1,32 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class ArchivedRow(models.Model):
+    """
+    A soft deleted row moved out of its table by common.archive.
+
+    `data` holds the field values of the row as dumped by the python serializer, so the
+    row can be put back in its table with the same primary key.
+    """
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'], name='unique_archived_row'
+            ),
+        ]
+        indexes = [
+            # Restores look up the rows of a deletion batch
+            models.Index(fields=['content_type', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type} {self.object_id} deleted at {self.deleted_at}'
@@ -8,3 +8,44 @@ class BaseModel(SoftDeleteModel):
 
     class Meta:
         abstract = True  # To prevent django migrations
+        # The default managers filter on `is_deleted` and the lists are sorted by the
+        # last update (see common.pagination), a partial index per manager serves both.
+        # Models declaring their own `indexes` must extend these (see common.checks).
+        indexes = [
+            models.Index(
+                fields=['-updated_at', 'id'],
+                condition=models.Q(is_deleted=False),
+                name='%(app_label)s_%(class)s_live_idx',
+            ),
+            models.Index(
+                fields=['-updated_at', 'id'],
+                condition=models.Q(is_deleted=True),
+                name='%(app_label)s_%(class)s_deleted_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the stored values (by attname) to tell what changed on the next save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if fields is None or field.name in fields or field.attname in fields:
+                loaded[field.attname] = getattr(self, field.attname)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The post_save receivers have seen the previous values, the row now matches
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
@@ -0,0 +1,53 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxEmail(models.Model):
+    """
+    An email written by a request and sent later by common.tasks.send_queued_emails.
+
+    The body is rendered when the email is sent, from `template_name` with the `.txt`
+    and, if it exists, the `.html` extension and the JSON `context`. The context, which
+    may hold secrets such as a reset link, is cleared once the email is sent and the sent
+    rows are deleted after EMAIL_RETENTION (see common.mail).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        # Claimed by a worker until `next_attempt_at`, due again afterwards
+        SENDING = 'sending', 'Sending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField()
+    template_name = models.CharField(max_length=255)
+    context = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The task only looks up the emails still to send
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=Q(status__in=['pending', 'sending']),
+                name='common_outbox_due_idx',
+            ),
+            # And the sent ones past the retention
+            models.Index(
+                fields=['sent_at'],
+                condition=Q(status='sent'),
+                name='common_outbox_sent_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)} ({self.status})'
@@ -2,13 +2,24 @@
 # NOTE: pip install django-soft-delete 0.9.21
 #
 
-from django.db import models
+from typing import NamedTuple
+from django.apps import apps
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.utils import timezone
 from django.conf import settings
-from django.db.models.fields.related_descriptors import (
-    ReverseManyToOneDescriptor,
-    ReverseOneToOneDescriptor,
-)
+
+
+# Sent once per model after a set-based soft delete, with the `deleted_at` timestamp
+# shared by all the rows of the cascade. Per-row signals (post_save) are not sent for
+# the rows updated in bulk, receivers can find them with
+# `sender.deleted_objects.filter(deleted_at=deleted_at)`.
+post_soft_delete = Signal()
+
+# Sent once per model after a set-based restore. The restored rows get `restored_at` as
+# their `updated_at`, receivers can find them with
+# `sender.objects.filter(updated_at=restored_at)`.
+post_soft_restore = Signal()
 
 
 def get_settings():
@@ -18,13 +29,143 @@ def get_settings():
     return getattr(settings, 'DJANGO_SOFTDELETE_SETTINGS', default_settings)
 
 
+class SoftDeleteRelation(NamedTuple):
+    """
+    A reverse relation to a soft delete model: `model` rows point to the parent by `field_name`.
+    """
+
+    model: type
+    field_name: str
+
+
+# Reverse relations from soft delete models, per soft delete model. Built once all the
+# models are loaded (see common.apps.CommonConfig.ready) so cascades don't introspect
+# the models on every delete or restore.
+_relation_graph = {}
+
+
+def _reverse_relations(model):
+    return tuple(
+        SoftDeleteRelation(relation.related_model, relation.field.name)
+        for relation in model._meta.related_objects
+        if (relation.one_to_many or relation.one_to_one)
+        and issubclass(relation.related_model, SoftDeleteModel)
+    )
+
+
+def build_relation_graph():
+    _relation_graph.clear()
+    for model in apps.get_models():
+        if issubclass(model, SoftDeleteModel):
+            _relation_graph[model] = _reverse_relations(model)
+    return _relation_graph
+
+
+def get_soft_delete_relations(model):
+    """
+    Reverse one-to-many and one-to-one relations of `model` from soft delete models.
+    """
+    model = model._meta.concrete_model
+    try:
+        return _relation_graph[model]
+    except KeyError:
+        # Not a registered model, or called before the app registry is ready
+        return _reverse_relations(model)
+
+
+def collect_related(model, queryset, filters, path=()):
+    """
+    Yield (model, queryset) for the rows matching `filters` that depend on `queryset`.
+
+    Each queryset selects its rows with an `id__in` subquery on its parent, children
+    come before their parent so every subquery is evaluated before the rows it reads
+    are updated.
+    """
+    path = path + (model,)
+    for related_model, field_name in get_soft_delete_relations(model):
+        if related_model in path:
+            continue  # Self-referencing or circular relation
+
+        related = related_model.all_objects.filter(
+            **filters, **{f'{field_name}__in': queryset.values('pk')}
+        )
+        yield from collect_related(related_model, related, filters, path)
+        yield related_model, related
+
+
+def _has_updated_at(model):
+    return any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+def _soft_delete_values(model, deleted_at):
+    values = {'is_deleted': True, 'deleted_at': deleted_at}
+    if _has_updated_at(model):
+        values['updated_at'] = deleted_at
+    return values
+
+
+def _restore_values(model, restored_at):
+    values = {'is_deleted': False, 'deleted_at': None}
+    if _has_updated_at(model):
+        values['updated_at'] = restored_at
+    return values
+
+
+def _update_related(model, queryset, filters, values, signal, **signal_kwargs):
+    updated_models = []
+    for related_model, related in list(collect_related(model, queryset, filters)):
+        if related.update(**values(related_model)):
+            updated_models.append(related_model)
+
+    for related_model in dict.fromkeys(updated_models):
+        signal.send(sender=related_model, **signal_kwargs)
+
+
+def soft_delete_related(model, queryset, deleted_at):
+    """
+    Soft delete the rows that depend on `queryset` with one UPDATE per related table.
+    """
+    _update_related(
+        model,
+        queryset,
+        {'is_deleted': False},
+        lambda related_model: _soft_delete_values(related_model, deleted_at),
+        post_soft_delete,
+        deleted_at=deleted_at,
+    )
+
+
+def restore_related(model, queryset, deleted_at, restored_at):
+    """
+    Restore the rows that were soft deleted with `queryset` in the `deleted_at` batch.
+
+    Rows deleted on their own, before or after the cascade, have another `deleted_at`
+    and stay deleted.
+    """
+    _update_related(
+        model,
+        queryset,
+        {'is_deleted': True, 'deleted_at': deleted_at},
+        lambda related_model: _restore_values(related_model, restored_at),
+        post_soft_restore,
+        restored_at=restored_at,
+    )
+
+
 class SoftDeleteQuerySet(models.query.QuerySet):
     def delete(self, cascade=None):
-        cascade = get_settings().get('cascade', True)
-        if cascade:  # delete one by one if cascade
-            for obj in self.all():
-                obj.delete(cascade=cascade)
-        return self.update(is_deleted=True, deleted_at=timezone.now())
+        if cascade is None:
+            cascade = get_settings().get('cascade', True)
+
+        deleted_at = timezone.now()
+        with transaction.atomic(using=self.db):
+            if cascade:
+                soft_delete_related(self.model, self, deleted_at)
+            count = self.update(**_soft_delete_values(self.model, deleted_at))
+
+        if count:
+            post_soft_delete.send(sender=self.model, deleted_at=deleted_at)
+        return count
 
     def hard_delete(self):
         return super().delete()
@@ -36,9 +177,26 @@ class SoftDeleteManager(models.Manager):
 
 
 class DeletedQuerySet(models.query.QuerySet):
-    def restore(self, *args, **kwargs):
+    def restore(self, *args, cascade=None, **kwargs):
+        if cascade is None:
+            cascade = get_settings().get('cascade', True)
+
         qs = self.filter(*args, **kwargs)
-        qs.update(is_deleted=False, deleted_at=None)
+        restored_at = timezone.now()
+        count = 0
+        with transaction.atomic(using=self.db):
+            if cascade:
+                # One cascade per deletion batch
+                batches = qs.order_by().values_list('deleted_at', flat=True).distinct()
+                for deleted_at in list(batches):
+                    if deleted_at is not None:
+                        batch = qs.filter(deleted_at=deleted_at)
+                        restore_related(self.model, batch, deleted_at, restored_at)
+            count = qs.update(**_restore_values(self.model, restored_at))
+
+        if count:
+            post_soft_restore.send(sender=self.model, restored_at=restored_at)
+        return count
 
 
 class DeletedManager(models.Manager):
@@ -63,48 +221,48 @@ class SoftDeleteModel(models.Model):
         ordering = ['-updated_at']
 
     def delete(self, cascade=None, *args, **kwargs):
-        cascade = get_settings().get('cascade', True)
-        self.is_deleted = True
-        self.deleted_at = timezone.now()
-        self.save()
-        self.after_delete()
-        if cascade:
-            self.delete_related_objects()
+        if cascade is None:
+            cascade = get_settings().get('cascade', True)
+
+        with transaction.atomic():
+            self.is_deleted = True
+            self.deleted_at = timezone.now()
+            self.save()
+            self.after_delete()
+            if cascade:
+                self.delete_related_objects()
 
     def restore(self, cascade=None):
-        cascade = get_settings().get('cascade', True)
-        self.is_deleted = False
-        self.deleted_at = None
-        self.save()
-        self.after_restore()
-        if cascade:
-            self.restore_related_objects()
+        if cascade is None:
+            cascade = get_settings().get('cascade', True)
+
+        deleted_at = self.deleted_at
+        with transaction.atomic():
+            self.is_deleted = False
+            self.deleted_at = None
+            self.save()
+            self.after_restore()
+            if cascade and deleted_at is not None:
+                self.restore_related_objects(deleted_at)
 
     def hard_delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
 
     def get_related_objects(self):
-        attributes = vars(self._meta.model)
-        reverse_attributes = [
-            a
-            for a, b in attributes.items()
-            if type(b) in [ReverseManyToOneDescriptor, ReverseOneToOneDescriptor]
-        ]
         related_objects = []
-        for reverse_attribute in reverse_attributes:
-            try:
-                related_objects.extend(list(getattr(self, reverse_attribute).all()))
-            except Exception as e:
-                pass  # Consider logging the exception
+        for related_model, field_name in get_soft_delete_relations(self._meta.model):
+            related_objects.extend(related_model.objects.filter(**{field_name: self}))
         return related_objects
 
     def delete_related_objects(self):
-        for obj in self.get_related_objects():
-            obj.delete()
+        model = self._meta.model
+        soft_delete_related(model, model.all_objects.filter(pk=self.pk), self.deleted_at)
 
-    def restore_related_objects(self):
-        for obj in self.get_related_objects():
-            obj.restore()
+    def restore_related_objects(self, deleted_at):
+        model = self._meta.model
+        restore_related(
+            model, model.all_objects.filter(pk=self.pk), deleted_at, timezone.now()
+        )
 
     def after_delete(self):
         pass
@@ -1,15 +1,29 @@
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import (
     BasePagination,
     PageNumberPagination,
     LimitOffsetPagination,
     CursorPagination,
 )
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_CACHE_TIMEOUT = 60
 
 
 class LargeResultsSetPagination(PageNumberPagination):
     page_size = 1000
     page_size_query_param = 'page_size'
-    max_page_size = 10000
+    max_page_size = 1000
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -29,8 +43,9 @@ class PageNumberResultsSetPagination(PageNumberPagination):
         model = queryset.model
 
         if hasattr(model, 'updated_at'):
-            # Order by 'updated_at' if it exists
-            queryset = queryset.order_by('-updated_at')
+            # Order by 'updated_at' if it exists, with the id as a tie-breaker to follow
+            # the partial indexes of BaseModel
+            queryset = queryset.order_by('-updated_at', 'id')
         else:
             # Otherwise, order by 'id'
             queryset = queryset.order_by('-id')
@@ -68,20 +83,154 @@ class CursorResultsSetPagination(CursorPagination):
     ordering = '-id'
 
 
+def estimated_count(queryset):
+    """
+    Row count of `queryset` for display, without a COUNT(*) on every request.
+
+    PostgreSQL gives the planner's estimate, other databases count once and keep the
+    result in the cache for COUNT_CACHE_TIMEOUT seconds.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    key = f'pagination:count:{queryset.model._meta.label_lower}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class KeysetResultsSetPagination(BasePagination):
+    """
+    Pages after (or before) the last row seen, ordered on (-updated_at, id).
+
+    The cursor holds the sort key of that row, so a page is an index range scan (see
+    the partial indexes of BaseModel) whatever its depth, and rows inserted meanwhile
+    don't shift the pages. Models without `updated_at` are ordered on -id. The total is
+    only given with `?count=true`, and estimated (see `estimated_count`).
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keyed_on_updated_at = hasattr(queryset.model, 'updated_at')
+        position, self.reverse = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = estimated_count(queryset)
+
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, self.reverse))
+        ordering = self.get_ordering(self.reverse)
+        rows = list(queryset.order_by(*ordering)[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        # A cursor means there are rows on the side it came from
+        if self.reverse:
+            self.has_previous, self.has_next = has_more, position is not None
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        return self.page
+
+    def get_paginated_response(self, data):
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+        return Response(OrderedDict(fields))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or self.max_page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, reverse):
+        ordering = ['-updated_at', 'id'] if self.keyed_on_updated_at else ['-id']
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        return ordering
+
+    def get_position_filter(self, position, reverse):
+        updated_at, pk = position
+        if not self.keyed_on_updated_at:
+            return Q(pk__gt=pk) if reverse else Q(pk__lt=pk)
+        if reverse:
+            return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__lt=pk)
+        return Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, pk__gt=pk)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            updated_at = payload['u'] and parse_datetime(payload['u'])
+            position = (updated_at, int(payload['i']))
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if self.keyed_on_updated_at and updated_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        payload = {'u': None, 'i': row.pk}
+        if self.keyed_on_updated_at:
+            payload['u'] = row.updated_at.isoformat()
+        if reverse:
+            payload['r'] = 1
+        encoded = b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
 class DynamicPagination(BasePagination):
     def paginate_queryset(self, queryset, request, view=None):
         # Determine the pagination style based on the 'pagination' query parameter
-        pagination_style = request.query_params.get('pagination', 'page_number')
+        pagination_style = request.query_params.get('pagination', 'keyset')
 
-        if pagination_style == 'page_number':
+        if pagination_style == 'keyset':
+            self.paginator = KeysetResultsSetPagination()
+        elif pagination_style == 'page_number':
             self.paginator = PageNumberResultsSetPagination()
         elif pagination_style == 'limit_offset':
             self.paginator = LimitOffsetPagination()
         elif pagination_style == 'cursor':
             self.paginator = CursorResultsSetPagination()
         else:
-            # Default to CustomPageNumberPagination if the type is not specified or recognized
-            self.paginator = PageNumberResultsSetPagination()
+            # Default to keyset pagination if the type is not recognized
+            self.paginator = KeysetResultsSetPagination()
 
         return self.paginator.paginate_queryset(queryset, request, view)
 
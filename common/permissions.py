@@ -1,4 +1,51 @@
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from rest_framework import permissions
+from .cache import bump_cache_version, cache_version
+
+
+# Codenames of the permissions a user has through their groups, cached per user. Any
+# change to the permissions of a group bumps the version and so invalidates every user,
+# a change to the groups of a user only drops that user's set (see apps.accounts.signals).
+PERMISSIONS_VERSION_KEY = 'permissions:version'
+PERMISSIONS_CACHE_TIMEOUT = 60 * 60
+
+
+def _codenames_key(user_id, version):
+    return f'permissions:codenames:{version}:{user_id}'
+
+
+def invalidate_all_permissions():
+    bump_cache_version(PERMISSIONS_VERSION_KEY)
+
+
+def invalidate_user_permissions(user_ids):
+    version = cache_version(PERMISSIONS_VERSION_KEY)
+    cache.delete_many([_codenames_key(user_id, version) for user_id in user_ids])
+
+
+def group_permission_codenames(user):
+    """
+    The codenames of the permissions `user` has through their groups.
+
+    Resolved with one query, then read from the cache until they change.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    key = _codenames_key(user.pk, cache_version(PERMISSIONS_VERSION_KEY))
+    codenames = cache.get(key)
+    if codenames is None:
+        # By id, `user` may be a user built from token claims (see apps.accounts.authentication)
+        codenames = frozenset(
+            Permission.objects.filter(group__user=user.pk).values_list('codename', flat=True)
+        )
+        cache.set(key, codenames, timeout=PERMISSIONS_CACHE_TIMEOUT)
+    return codenames
+
+
+def has_group_permission(user, codename):
+    return codename in group_permission_codenames(user)
 
 
 class HasAnyPermission(permissions.BasePermission):
@@ -8,3 +55,31 @@ class HasAnyPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         # Check if the user has any of the required permissions
         return any(request.user.has_perm(permission) for permission in self.required_permissions)
+
+
+class ActionPermissions(permissions.BasePermission):
+    """
+    Allow the superusers, and the users in a group with the permission of the action.
+
+    Subclasses set `model_name`, the permission of an action is `<prefix>_<model_name>`.
+    Actions missing from `action_prefixes` are denied.
+    """
+
+    model_name = None
+    action_prefixes = {
+        'list': 'view',
+        'retrieve': 'view',
+        'create': 'add',
+        'update': 'change',
+        'destroy': 'delete',
+    }
+
+    def has_permission(self, request, view):
+        if request.user.is_superuser:
+            return True
+
+        prefix = self.action_prefixes.get(view.action)
+        if prefix is None:
+            # Default to not allowing other actions
+            return False
+        return has_group_permission(request.user, f'{prefix}_{self.model_name}')
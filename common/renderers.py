@@ -0,0 +1,64 @@
+import csv
+import json
+from io import StringIO
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, for streaming with `csv.writer`.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _as_rows(data):
+    if isinstance(data, dict):
+        return [data]
+    if isinstance(data, (list, tuple)):
+        return [item if isinstance(item, dict) else {'detail': item} for item in data]
+    return [{'detail': data}]
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders a dict or a list of dicts as CSV.
+
+    Large exports should stream their rows with a `StreamingHttpResponse` instead; the
+    renderer then only serves the content negotiation and the error responses.
+    """
+
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        rows = _as_rows(data)
+        fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+        output = StringIO()
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders a dict or a list of dicts as newline delimited JSON, one object per line.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in _as_rows(data))
+        return ''.join(lines).encode(self.charset)
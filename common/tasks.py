@@ -0,0 +1,30 @@
+from celery import shared_task
+from .archive import archive_soft_deleted
+from .mail import EMAIL_BATCH_SIZE, purge_sent, send_queued
+
+
+@shared_task
+def archive_soft_deleted_rows(days=None):
+    """
+    Move the rows soft deleted more than `days` ago out of the live tables.
+    """
+    return archive_soft_deleted(days)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_queued_emails(self, batch_size=EMAIL_BATCH_SIZE):
+    """
+    Send the due emails of the outbox, retried when the email backend can't be reached.
+    """
+    try:
+        return send_queued(batch_size)
+    except OSError as e:
+        raise self.retry(exc=e)
+
+
+@shared_task
+def purge_sent_emails():
+    """
+    Delete the sent emails of the outbox past their retention.
+    """
+    return {'emails_purged': purge_sent()}
@@ -0,0 +1,96 @@
+"""
+Upload handler rejecting oversize or non-image files while they are received.
+
+Django only runs the model field validators once the whole file has been received.
+`ImageUploadGuard` runs in front of the default upload handlers instead: it stops the
+transfer as soon as a file exceeds the size limit, checks the magic bytes of the first
+chunk, and reads the dimensions from the image header without decoding the pixels.
+"""
+
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+
+# Magic bytes of the accepted formats, the same as common.validators.validate_image_extension
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+}
+# The header of the formats above fits in the first chunks
+MAX_HEADER_SIZE = 64 * 1024
+
+
+def sniff_image_format(data):
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return image_format
+    return None
+
+
+class ImageUploadGuard(FileUploadHandler):
+    """
+    Guards the files of `field_names`, the other files go through untouched.
+    """
+
+    def __init__(self, request=None, field_names=(), max_size=None, max_pixels=None):
+        super().__init__(request)
+        self.field_names = set(field_names)
+        self.max_size = max_size or settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        self.max_pixels = max_pixels or Image.MAX_IMAGE_PIXELS
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.guarded = field_name in self.field_names
+        self.size = 0
+        # The start of the file until the image header has been read
+        self.header = b''
+        self.header_read = False
+
+    def reject(self, message):
+        raise ValidationError({self.field_name: [message]})
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.guarded:
+            return raw_data
+
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            max_size_mb = self.max_size / (1024**2)
+            self.reject(f'File size cannot exceed {max_size_mb} MB.')
+
+        if start == 0 and sniff_image_format(raw_data) is None:
+            self.reject(
+                'Invalid image format. Please upload a valid image file (JPG, JPEG, PNG, GIF).'
+            )
+
+        if not self.header_read:
+            self.read_header(raw_data)
+        return raw_data
+
+    def read_header(self, raw_data):
+        self.header += raw_data
+        try:
+            # Lazy, only the header is parsed and no pixel memory is allocated
+            with Image.open(BytesIO(self.header)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.reject(f'Image dimensions cannot exceed {self.max_pixels} pixels.')
+        except (OSError, SyntaxError):
+            if len(self.header) > MAX_HEADER_SIZE:
+                self.reject('The image file is corrupted.')
+            return  # Wait for the next chunk
+
+        self.header, self.header_read = b'', True
+        if width * height > self.max_pixels:
+            self.reject(f'Image dimensions cannot exceed {self.max_pixels} pixels.')
+
+    def file_complete(self, file_size):
+        if self.guarded and not self.header_read:
+            self.reject('The image file is corrupted.')
+        # Let the next handlers build the file
+        return None
@@ -51,6 +51,7 @@ THIRD_PARTY_APPS = [
 ]
 
 PROJECT_APPS = [
+    'common',
     'apps.accounts',
     'apps.hotel',
 ]
@@ -75,9 +76,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # No database query on safe methods, see apps.accounts.authentication
+        'apps.accounts.authentication.UserJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'common.pagination.DynamicPagination',
     'PAGE_SIZE': 100,
@@ -111,13 +112,17 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
     # "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
     "TOKEN_OBTAIN_SERIALIZER": "apps.accounts.serializers.UserTokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    # "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "apps.accounts.serializers.UserTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# Threads hashing the passwords of the sign-in requests, see apps.accounts.signin
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -181,6 +186,15 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'mediafiles'
 
+# How the media files are delivered (see common.media): 'django' with a FileResponse sent
+# with sendfile() by the WSGI server, 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache, lighttpd) by the web server
+MEDIA_DELIVERY = os.getenv('MEDIA_DELIVERY', 'django')
+# The internal nginx location aliasing MEDIA_ROOT, for 'x-accel-redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# Content-addressed files, never replaced under the same name, cached for a year
+MEDIA_IMMUTABLE_PATHS = ('profile_images/renditions/',)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -199,6 +213,28 @@ if CORS_CSRF_ORIGINS:
     CORS_ALLOWED_ORIGINS += CORS_CSRF_ORIGINS.split(',')
     CSRF_TRUSTED_ORIGINS += CORS_CSRF_ORIGINS.split(',')
 
+# Cache settings
+# Use Redis when configured so the cache is shared by the web and Celery workers,
+# otherwise fall back to Django's default per-process local memory cache.
+CACHE_URL = os.getenv('CACHE_URL')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+# Email settings, the emails are sent from an outbox by Celery (see common.mail)
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@example.com')
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')  # Use Redis as the broker
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
@@ -208,9 +244,37 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
 # Celery Beat Schedule
 CELERY_BEAT_SCHEDULE = {
-    'update-room-status-every-minute': {
+    # Room statuses are updated by jobs scheduled per booking (apps.hotel.scheduler),
+    # this sweep queues the jobs coming due and reconciles the ones that were missed.
+    # It must run more often than ROOM_STATUS_SYNC_HORIZON.
+    'update-room-status-every-half-hour': {
         'task': 'apps.hotel.tasks.update_room_status',
-        'schedule': crontab(minute='*'),  # Every minute
+        'schedule': crontab(minute='*/30'),  # Every half hour
+    },
+    'rebuild-revenue-rollups-every-night': {
+        'task': 'apps.hotel.tasks.rebuild_revenue_rollups',
+        'schedule': crontab(minute=30, hour=2),  # Every night at 02:30
+    },
+    'flush-expired-tokens-every-night': {
+        'task': 'apps.accounts.tasks.flush_expired_tokens',
+        'schedule': crontab(minute=0, hour=3),  # Every night at 03:00
+    },
+    'cache-revoked-tokens-every-hour': {
+        'task': 'apps.accounts.tasks.cache_revoked_tokens',
+        'schedule': crontab(minute=15),  # Every hour
+    },
+    # The emails are queued when written, this sweep sends the retries and the missed ones
+    'send-queued-emails-every-minute': {
+        'task': 'common.tasks.send_queued_emails',
+        'schedule': crontab(),  # Every minute
+    },
+    'purge-sent-emails-every-night': {
+        'task': 'common.tasks.purge_sent_emails',
+        'schedule': crontab(minute=30, hour=4),  # Every night at 04:30
+    },
+    'archive-soft-deleted-rows-every-night': {
+        'task': 'common.tasks.archive_soft_deleted_rows',
+        'schedule': crontab(minute=0, hour=4),  # Every night at 04:00
     },
     # 'update-room-status-every-midnight': {
     #     'task': 'apps.hotel.tasks.update_room_status',
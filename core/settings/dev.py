@@ -6,6 +6,9 @@ DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 
 ALLOWED_HOSTS = ["*"]
 
+# Print the emails instead of sending them
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -1,3 +1,4 @@
+from django.core.exceptions import ImproperlyConfigured
 from .common import *
 
 
@@ -19,3 +20,8 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT'),
     }
 }
+
+# The workers share the cached group permissions (see common.permissions), whose
+# invalidations would only reach the process making them with a local memory cache
+if not CACHE_URL:
+    raise ImproperlyConfigured('CACHE_URL must be set to a cache shared by all the processes.')